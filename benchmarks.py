@@ -0,0 +1,372 @@
+import argparse
+import glob
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import recommendation_system as rs
+from synthetic_data import generate_synthetic_data
+
+# ----------------------------------------------------------------------
+# BENCHMARK SETTINGS
+# ----------------------------------------------------------------------
+DEFAULT_REPEAT = 7  # Timed runs per benchmark (the first run is a warm-up)
+QUERY_COUNT = 50  # Student profiles timed by the query benchmarks
+ROSTER_SIZES = [100, 1000]  # Students per recommend_batch call
+
+# ----------------------------------------------------------------------
+
+
+def time_call(func, repeat=DEFAULT_REPEAT, number=1):
+    """
+    Calls func() repeat times (after one warm-up call) and returns the
+    timings in milliseconds as a dict with min, median and mean. With
+    number > 1 every timed run calls func() number times and the timings
+    are per call.
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) * 1000 / number)
+
+    return timing_stats(timings)
+
+
+def timing_stats(timings):
+    """Summarizes timings (milliseconds) as a dict with min, median and mean."""
+    return {
+        'min_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.mean(timings),
+    }
+
+
+def sample_students(df_cutoffs, count, seed=0):
+    """Returns 'count' random student profiles (a roster DataFrame) that have candidate courses."""
+    rng = random.Random(seed)
+    districts = sorted(df_cutoffs['District'].unique())
+    return pd.DataFrame({
+        'Student_ID': range(count),
+        'Z_Score': [round(rng.uniform(0.8, 2.2), 4) for _ in range(count)],
+        'District': [rng.choice(districts) for _ in range(count)],
+        'Primary_Field': [rng.choice(rs.PREFERENCE_FIELD_OPTIONS) for _ in range(count)],
+        'Secondary_Field': [rng.choice(rs.PREFERENCE_FIELD_OPTIONS) for _ in range(count)],
+        'Stream': [rng.choice(list(rs.STREAM_COURSE_MAP)) for _ in range(count)],
+    })
+
+
+def _query_arguments(students):
+    """calculate_compatibility_score keyword arguments for every roster row."""
+    return [
+        {'student_z_score': row.Z_Score, 'district': row.District, 'primary_field': row.Primary_Field,
+         'secondary_field': row.Secondary_Field, 'stream': row.Stream}
+        for row in students.itertuples()
+    ]
+
+
+def bench_cold_load(file_paths):
+    """load_data: full CSV parse + averaging vs. the on-disk cutoff cache."""
+    rs.load_data(file_paths)  # Make sure the cache file exists
+    return {
+        'csv_parse': time_call(lambda: rs.load_data(file_paths, use_cache=False), repeat=3),
+        'cache_hit': time_call(lambda: rs.load_data(file_paths)),
+    }
+
+
+def bench_district_filter(file_paths):
+    """District filter on object strings (upper-cased per call) vs. the categorical column."""
+    df_cutoffs = rs.load_data(file_paths)
+    df_strings = df_cutoffs.astype({'Course': 'str', 'University': 'str', 'District': 'str'})
+    district_code = df_cutoffs['District'].cat.categories.get_loc('COLOMBO')
+    return {
+        'string_upper_eq': time_call(lambda: df_strings['District'].str.upper() == 'COLOMBO'),
+        'categorical_eq': time_call(lambda: df_cutoffs['District'] == 'COLOMBO'),
+        'integer_codes_eq': time_call(lambda: df_cutoffs['District'].cat.codes.to_numpy() == district_code),
+    }
+
+
+def bench_parallel_load(file_paths):
+    """Uncached load_data with 1, 2 and 4 parsing workers for a growing number of yearly files."""
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Extra "years" are copies of the given files
+        copied_paths = []
+        for copy in range(4):
+            for file_path in file_paths:
+                copied_paths.append(os.path.join(data_dir, f'{copy}_{os.path.basename(file_path)}'))
+                shutil.copy(file_path, copied_paths[-1])
+
+        for file_count in (len(file_paths), 2 * len(file_paths), 4 * len(file_paths)):
+            for workers in (1, 2, 4):
+                results[f'{file_count}_files_{workers}_workers'] = time_call(
+                    lambda: rs.load_data(copied_paths[:file_count], use_cache=False, workers=workers), repeat=3
+                )
+    return results
+
+
+def bench_single_query(file_paths):
+    """One calculate_compatibility_score call (per-call time over QUERY_COUNT profiles)."""
+    df_cutoffs = rs.load_data(file_paths)
+    queries = _query_arguments(sample_students(df_cutoffs, QUERY_COUNT))
+    cutoff_index = rs.CutoffIndex(df_cutoffs)
+    query_cycle = itertools.cycle(queries)
+
+    return {
+        'build_index': time_call(lambda: rs.CutoffIndex(df_cutoffs), repeat=3),
+        'memoized_index': time_call(
+            lambda: rs.calculate_compatibility_score(df_cutoffs=df_cutoffs, **next(query_cycle)), number=QUERY_COUNT
+        ),
+        'prebuilt_index': time_call(
+            lambda: rs.calculate_compatibility_score(df_cutoffs=df_cutoffs, cutoff_index=cutoff_index,
+                                                     **next(query_cycle)),
+            number=QUERY_COUNT
+        ),
+    }
+
+
+def bench_batch_query(file_paths):
+    """recommend_batch for whole rosters, reported per student."""
+    df_cutoffs = rs.load_data(file_paths)
+    cutoff_index = rs.get_cutoff_index(df_cutoffs)
+    results = {}
+    for roster_size in ROSTER_SIZES:
+        roster = sample_students(df_cutoffs, roster_size)
+        stats = time_call(lambda: rs.recommend_batch(roster, df_cutoffs, cutoff_index=cutoff_index), repeat=3)
+        results[f'roster_{roster_size}_per_student'] = {name: value / roster_size for name, value in stats.items()}
+    return results
+
+
+def bench_cache_hit(file_paths):
+    """RecommendationCache: misses vs. exact hits vs. candidate-list hits with a new Z-Score."""
+    df_cutoffs = rs.load_data(file_paths)
+    cutoff_index = rs.get_cutoff_index(df_cutoffs)
+    queries = _query_arguments(sample_students(df_cutoffs, QUERY_COUNT))
+    exact_cache = rs.RecommendationCache()
+    candidate_cache = rs.RecommendationCache(candidate_lists=True)
+    z_offsets = np.linspace(-0.2, 0.2, 7)
+
+    def run_queries(cache, clear=False, new_z_score=False):
+        for position, query in enumerate(queries):
+            if clear:
+                cache.clear()
+            if new_z_score:
+                query = dict(query, student_z_score=query['student_z_score'] + z_offsets[position % len(z_offsets)])
+            cache.recommend(df_cutoffs=df_cutoffs, cutoff_index=cutoff_index, **query)
+
+    results = {
+        'miss': time_call(lambda: run_queries(exact_cache, clear=True)),
+        'exact_hit': time_call(lambda: run_queries(exact_cache)),
+        'candidate_list_hit': time_call(lambda: run_queries(candidate_cache, new_z_score=True)),
+    }
+    # Per query
+    return {case: {name: value / QUERY_COUNT for name, value in stats.items()} for case, stats in results.items()}
+
+
+def pandas_score_candidates(candidates_df, table_rows, boost, student_z_score, k):
+    """
+    The former DataFrame implementation of steps 3-6 of
+    calculate_compatibility_score (a column per intermediate step), kept as
+    the baseline of bench_scoring_kernel.
+    """
+    eligible_count = np.searchsorted(candidates_df['Z_Score'].to_numpy(), student_z_score, side='right')
+    merged_df = candidates_df.iloc[:eligible_count].copy()
+    table_rows = table_rows[:eligible_count]
+
+    merged_df['Is_Eligible'] = merged_df['Z_Score'] <= student_z_score
+    merged_df['Safety_Margin'] = student_z_score - merged_df['Z_Score']
+    merged_df['Capped_Margin'] = np.clip(merged_df['Safety_Margin'], 0, rs.MAX_ZSCORE_MARGIN_CAP)
+    merged_df['Margin_Score'] = merged_df['Capped_Margin'] / rs.MAX_ZSCORE_MARGIN_CAP
+    merged_df['Preference_Boost'] = boost[:eligible_count]
+    merged_df['Compatibility_Score'] = (merged_df['Margin_Score'] * rs.WEIGHT_MARGIN) + \
+                                       (merged_df['Preference_Boost'] * rs.WEIGHT_PREFERENCE)
+
+    ranking = rs.rank_top_k(merged_df['Compatibility_Score'].to_numpy(), k, tiebreak=table_rows)
+    final_recommendations = merged_df.iloc[ranking].copy()
+    final_recommendations['Safety_Margin'] = final_recommendations['Safety_Margin'].round(4)
+    return rs._with_plain_strings(final_recommendations[rs.RECOMMENDATION_COLUMNS])
+
+
+def bench_scoring_kernel(file_paths):
+    """
+    Scoring and top-k of one query (steps 3-6): the NumPy kernel path vs. the
+    former pandas path, per query over QUERY_COUNT profiles. The two must
+    return identical results; kernel_only is the fused scoring step alone.
+    """
+    df_cutoffs = rs.load_data(file_paths)
+    cutoff_index = rs.get_cutoff_index(df_cutoffs)
+    k = rs.RECOMMENDATION_COUNT
+
+    cases = []
+    for query in _query_arguments(sample_students(df_cutoffs, QUERY_COUNT)):
+        candidates_df, table_rows = cutoff_index.lookup(query['stream'], query['district'])
+        if candidates_df is not None:
+            cutoffs = cutoff_index.candidate_cutoffs(query['stream'], query['district'])
+            boost = cutoff_index.preference_boost(table_rows, query['primary_field'], query['secondary_field'])
+            cases.append((candidates_df, table_rows, cutoffs, boost, query['student_z_score']))
+
+    for candidates_df, table_rows, cutoffs, boost, z_score in cases:
+        pd.testing.assert_frame_equal(pandas_score_candidates(candidates_df, table_rows, boost, z_score, k),
+                                      rs._score_candidates(cutoff_index, table_rows, cutoffs, boost, z_score, k))
+
+    def run_pandas():
+        for candidates_df, table_rows, _, boost, z_score in cases:
+            pandas_score_candidates(candidates_df, table_rows, boost, z_score, k)
+
+    def run_numpy():
+        for _, table_rows, cutoffs, boost, z_score in cases:
+            rs._score_candidates(cutoff_index, table_rows, cutoffs, boost, z_score, k)
+
+    def run_kernel():
+        for _, _, cutoffs, boost, z_score in cases:
+            rs._score_kernel(cutoffs, boost, z_score)
+
+    results = {
+        'pandas_path': time_call(run_pandas),
+        'numpy_path': time_call(run_numpy),
+        'kernel_only': time_call(run_kernel),
+    }
+    # Per query
+    return {case: {name: value / len(cases) for name, value in stats.items()} for case, stats in results.items()}
+
+
+def _run_python(code):
+    """Runs code in a fresh interpreter (the one running the benchmarks)."""
+    subprocess.run([sys.executable, '-c', code], check=True, capture_output=True)
+
+
+def _import_time_ms(module_name):
+    """Cumulative import time of module_name in a fresh interpreter, as reported by -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            check=True, capture_output=True, text=True).stderr
+    for line in stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module_name:
+            return int(fields[1]) / 1000
+    return None
+
+
+def bench_startup(file_paths):
+    """
+    Start of a new worker process: import times (-X importtime) and the wall
+    time from interpreter start to the first recommendation, with a cached
+    cutoff table. python_startup is the bare interpreter, for reference.
+    """
+    rs.load_data(file_paths)  # The first response reads the cutoff cache
+    first_response = (
+        f"import recommendation_system as rs; rs.CUTOFF_CACHE_DIR = {rs.CUTOFF_CACHE_DIR!r}; "
+        f"df = rs.load_data({list(file_paths)!r}); "
+        "rs.calculate_compatibility_score(1.5, 'COLOMBO', 'ENGINEERING', 'IT', 'Mathamatics', df)"
+    )
+
+    results = {
+        'python_startup': time_call(lambda: _run_python('pass'), repeat=5),
+        'import_recommendation_system': timing_stats([_import_time_ms('recommendation_system') for _ in range(5)]),
+        'import_pandas': timing_stats([_import_time_ms('pandas') for _ in range(5)]),
+    }
+    # Deferred by streamlit_app.py until the first chart is drawn
+    if importlib.util.find_spec('plotly') is not None:
+        results['import_plotly_express'] = timing_stats([_import_time_ms('plotly.express') for _ in range(5)])
+    results['first_response'] = time_call(lambda: _run_python(first_response), repeat=5)
+    return results
+
+
+BENCHMARKS = {
+    'cold_load': bench_cold_load,
+    'district_filter': bench_district_filter,
+    'parallel_load': bench_parallel_load,
+    'single_query': bench_single_query,
+    'batch_query': bench_batch_query,
+    'cache_hit': bench_cache_hit,
+    'scoring_kernel': bench_scoring_kernel,
+    'startup': bench_startup,
+}
+
+
+def print_results(name, results, baseline=None):
+    """Prints one benchmark's timings as a small table, with the change against a baseline run."""
+    print(f"\n{name}")
+    for case, stats in results.items():
+        line = f"  {case:<28} min {stats['min_ms']:9.3f} ms   median {stats['median_ms']:9.3f} ms"
+        baseline_stats = (baseline or {}).get(name, {}).get(case)
+        if baseline_stats:
+            line += f"   x{stats['median_ms'] / baseline_stats['median_ms']:.2f} vs. baseline"
+        print(line)
+
+
+def run_metadata(file_paths, scale):
+    """Describes the run (code version, environment, data) for the JSON results."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'data_files': {file_path: os.path.getsize(file_path) for file_path in file_paths},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Timing benchmarks for the recommendation pipeline.")
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--scale', type=int,
+                        help="Run on synthetic data this many times the real size (e.g. 10, 100, 1000).")
+    parser.add_argument('--data-dir', help="Run on the CSV files in this directory (see synthetic_data.py).")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results and run details to a JSON file.")
+    parser.add_argument('--compare', metavar='PATH', help="A previous --json file to compare the timings with.")
+    args = parser.parse_args()
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        if args.data_dir:
+            file_paths = sorted(glob.glob(os.path.join(args.data_dir, '*.csv')))
+        elif args.scale:
+            print(f"Generating synthetic data at {args.scale}x...")
+            file_paths = generate_synthetic_data(synthetic_dir, args.scale)
+        else:
+            file_paths = rs.ZSCORE_DATA_FILES
+        if not file_paths:
+            parser.error("no data files to benchmark")
+        if file_paths != rs.ZSCORE_DATA_FILES:
+            # Keep the app's own cutoff cache; the other data sets are cached for this run only
+            rs.CUTOFF_CACHE_DIR = os.path.join(synthetic_dir, rs.CUTOFF_CACHE_DIR)
+
+        all_results = {}
+        for name in args.names or BENCHMARKS:
+            all_results[name] = BENCHMARKS[name](file_paths)
+            print_results(name, all_results[name], baseline)
+
+        if args.json:
+            with open(args.json, 'w') as json_file:
+                json.dump({'metadata': run_metadata(file_paths, args.scale or 1), 'results': all_results},
+                          json_file, indent=2)
+            print(f"\nWrote the results to '{args.json}'.")
@@ -0,0 +1,255 @@
+import argparse
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from recommendation_system import load_data, get_cutoff_index, ZSCORE_DATA_FILES, STREAM_COURSE_MAP
+
+# ----------------------------------------------------------------------
+# REPORT SETTINGS
+# ----------------------------------------------------------------------
+REPORT_Z_MIN = -1.0  # Lowest Z-Score band start
+REPORT_Z_MAX = 4.0  # Highest Z-Score band end
+REPORT_BAND_WIDTH = 0.1  # Width of one Z-Score band
+REPORT_CHUNK_ROWS = 100000  # Report rows built and written per chunk (bounds memory)
+REPORT_WORKERS = 1  # Worker processes building chunks (1 = in this process)
+REPORT_MAX_IN_FLIGHT = 2  # Chunks queued or waiting to be written per worker
+
+# One row per (district, stream, Z-Score band, reachable course)
+REPORT_COLUMNS = ['District', 'Stream', 'Z_From', 'Z_To', 'Course', 'University', 'Z_Score', 'Safety_Margin']
+
+# ----------------------------------------------------------------------
+
+# Cutoff index of a worker process, loaded once by init_report_worker
+_worker_index = None
+
+
+def band_edges(band_width=REPORT_BAND_WIDTH, z_min=REPORT_Z_MIN, z_max=REPORT_Z_MAX):
+    """Returns the edges of the Z-Score bands from z_min to z_max (band i is edges[i] to edges[i + 1])."""
+    band_count = int(np.ceil(round((z_max - z_min) / band_width, 9)))
+    return np.round(z_min + band_width * np.arange(band_count + 1), 4)
+
+
+def report_plan(cutoff_index, districts, streams, edges, chunk_rows=REPORT_CHUNK_ROWS):
+    """
+    Splits the report into chunks of at most chunk_rows rows, lazily.
+
+    A course is in reach of a band if its cutoff is at or below the band's
+    start, so every student in the band is eligible. The candidates of a
+    (stream, district) pair are sorted by cutoff once (in the CutoffIndex),
+    so each band reaches a prefix of them, found by binary search. Yields
+    every chunk as a list of segments (district, stream, band, start, stop):
+    rows start:stop of that band's prefix. Only the plan is computed here,
+    never the rows, so the plan costs the same at any data size.
+    """
+    segments, size = [], 0
+    for district in districts:
+        for stream in streams:
+            cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+            if cutoffs is None:
+                continue
+            reach = np.searchsorted(cutoffs, edges[:-1], side='right')
+            for band, count in enumerate(reach):
+                start = 0
+                while start < count:
+                    stop = min(count, start + chunk_rows - size)
+                    segments.append((district, stream, band, start, stop))
+                    size += stop - start
+                    start = stop
+                    if size == chunk_rows:
+                        yield segments
+                        segments, size = [], 0
+    if segments:
+        yield segments
+
+
+def build_chunk(cutoff_index, segments, edges):
+    """Builds the report rows (REPORT_COLUMNS) of one planned chunk as a DataFrame (empty for no segments)."""
+    row_parts = [np.zeros(0, dtype=np.intp)]
+    band_parts = [np.zeros(0, dtype=np.intp)]
+    stream_parts = [np.zeros(0, dtype=object)]
+    for district, stream, band, start, stop in segments:
+        _, table_rows = cutoff_index.lookup(stream, district)
+        row_parts.append(table_rows[start:stop])
+        band_parts.append(np.full(stop - start, band))
+        stream_parts.append(np.full(stop - start, stream, dtype=object))
+
+    table_rows = np.concatenate(row_parts)
+    bands = np.concatenate(band_parts)
+    cutoffs = cutoff_index.z_scores[table_rows]
+    return pd.DataFrame({
+        'District': cutoff_index.text_values('District', table_rows),
+        'Stream': pd.array(np.concatenate(stream_parts), dtype='str'),
+        'Z_From': edges[bands],
+        'Z_To': edges[bands + 1],
+        'Course': cutoff_index.text_values('Course', table_rows),
+        'University': cutoff_index.text_values('University', table_rows),
+        'Z_Score': cutoffs,
+        # Margin of the band's lowest Z-Score
+        'Safety_Margin': (edges[bands] - cutoffs).round(4),
+    })
+
+
+def encode_chunk(chunk_df, output_format):
+    """
+    Returns (row count, payload) of a chunk as it is handed to the writer:
+    the payload is CSV text (no header) or the DataFrame itself for Parquet.
+    """
+    if output_format == 'csv':
+        return len(chunk_df), chunk_df.to_csv(index=False, header=False)
+    return len(chunk_df), chunk_df
+
+
+def init_report_worker(file_paths, cutoff_estimate):
+    """Pool initializer: loads the cutoff table (normally from the on-disk cache) and its index once."""
+    global _worker_index
+    df_cutoffs = load_data(file_paths)
+    if df_cutoffs is not None:
+        _worker_index = get_cutoff_index(df_cutoffs, cutoff_estimate)
+
+
+def report_worker_chunk(segments, edges, output_format):
+    """Worker task: builds and encodes one planned chunk."""
+    return encode_chunk(build_chunk(_worker_index, segments, edges), output_format)
+
+
+def parallel_chunks(plan, edges, output_format, file_paths, cutoff_estimate, workers):
+    """
+    Yields the encoded chunks of the plan, in plan order, built by a pool of
+    worker processes. At most REPORT_MAX_IN_FLIGHT chunks per worker are
+    queued or waiting to be written, so a slow writer never lets finished
+    chunks pile up in memory.
+    """
+    # Imported here: multiprocessing is only needed for parallel exports
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_report_worker,
+                             initargs=(file_paths, cutoff_estimate)) as executor:
+        in_flight = deque()
+        for segments in plan:
+            in_flight.append(executor.submit(report_worker_chunk, segments, edges, output_format))
+            if len(in_flight) >= REPORT_MAX_IN_FLIGHT * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def write_csv(output_file, chunks):
+    """Writes the header and then every CSV chunk as it arrives. Returns the rows written."""
+    rows = 0
+    with open(output_file, 'w', newline='') as csv_file:
+        csv_file.write(','.join(REPORT_COLUMNS) + '\n')
+        for chunk_rows, chunk_text in chunks:
+            csv_file.write(chunk_text)
+            rows += chunk_rows
+    return rows
+
+
+def write_parquet(output_file, chunks, empty_df):
+    """
+    Writes every chunk as a row group of one Parquet file (needs pyarrow).
+    Without any chunk, empty_df (an empty report) is written, so the file
+    still has the report's columns, like the CSV header. Returns the rows
+    written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows, writer = 0, None
+    try:
+        for chunk_rows, chunk_df in chunks:
+            table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, table.schema)
+            writer.write_table(table)
+            rows += chunk_rows
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(empty_df, preserve_index=False), output_file)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_eligibility_report(output_path, file_paths=ZSCORE_DATA_FILES, districts=None, streams=None,
+                              band_width=REPORT_BAND_WIDTH, output_format=None, workers=None,
+                              chunk_rows=REPORT_CHUNK_ROWS, cutoff_estimate=None):
+    """
+    Writes the eligibility report: for every district, stream and Z-Score
+    band, every course in reach (see report_plan), one row each.
+
+    The rows are produced chunk by chunk through a generator pipeline
+    (plan -> build -> encode -> write), so memory stays bounded by a few
+    chunks however large the report grows. With workers > 1 (default
+    REPORT_WORKERS) the chunks are built in a process pool. output_format
+    is 'csv' or 'parquet' (default: from the file extension; Parquet needs
+    pyarrow). The file is written under a temporary name and renamed when
+    complete. Returns the number of rows written, or None (after printing
+    the reason) if the data or the Parquet writer is unavailable.
+    """
+    if output_format is None:
+        output_format = 'parquet' if output_path.endswith('.parquet') else 'csv'
+    if output_format not in ('csv', 'parquet'):
+        raise ValueError("output_format must be 'csv' or 'parquet'.")
+    streams = list(STREAM_COURSE_MAP) if streams is None else streams
+    for stream in streams:
+        if stream not in STREAM_COURSE_MAP:
+            raise ValueError(f"Unknown stream '{stream}'. Choose from: {', '.join(STREAM_COURSE_MAP)}.")
+    workers = REPORT_WORKERS if workers is None else workers
+
+    df_cutoffs = load_data(file_paths)
+    if df_cutoffs is None:
+        return None
+    cutoff_index = get_cutoff_index(df_cutoffs, cutoff_estimate)
+
+    districts = cutoff_index.district_names if districts is None else [district.upper() for district in districts]
+    for district in districts:
+        if district not in cutoff_index.district_names:
+            print(f"Warning: No cutoff data found for district: {district}; it is left out of the report.")
+    edges = band_edges(band_width)
+    plan = report_plan(cutoff_index, districts, streams, edges, chunk_rows)
+
+    if workers > 1:
+        chunks = parallel_chunks(plan, edges, output_format, file_paths, cutoff_estimate, workers)
+    else:
+        chunks = (encode_chunk(build_chunk(cutoff_index, segments, edges), output_format) for segments in plan)
+
+    tmp_path = f'{output_path}.tmp'
+    try:
+        if output_format == 'csv':
+            rows = write_csv(tmp_path, chunks)
+        else:
+            rows = write_parquet(tmp_path, chunks, build_chunk(cutoff_index, [], edges))
+    except ImportError:
+        print("Error: Parquet output needs pyarrow (pip install pyarrow).")
+        return None
+    except BaseException:
+        # Stops a pool that is still building chunks before the error propagates
+        chunks.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Exports every course each Z-Score band can reach, per district and stream."
+    )
+    parser.add_argument('output', help="Report file (.csv, or .parquet with pyarrow installed).")
+    parser.add_argument('--districts', nargs='*', help="Districts to include (default: all).")
+    parser.add_argument('--streams', nargs='*', choices=list(STREAM_COURSE_MAP), help="Streams to include (default: all).")
+    parser.add_argument('--band-width', type=float, default=REPORT_BAND_WIDTH, help="Width of a Z-Score band.")
+    parser.add_argument('--workers', type=int, default=REPORT_WORKERS, help="Worker processes.")
+    parser.add_argument('--cutoff-estimate', help="Cutoff to compare with (see CUTOFF_ESTIMATES).")
+    args = parser.parse_args()
+
+    row_count = export_eligibility_report(
+        args.output, districts=args.districts, streams=args.streams, band_width=args.band_width,
+        workers=args.workers, cutoff_estimate=args.cutoff_estimate
+    )
+    if row_count is not None:
+        print(f"Wrote {row_count} report rows to '{args.output}'.")
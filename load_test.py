@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from recommendation_system import STREAM_COURSE_MAP
+
+# ----------------------------------------------------------------------
+# LOAD TEST SETTINGS
+# ----------------------------------------------------------------------
+DEFAULT_REQUESTS = 500
+DEFAULT_CONCURRENCY = 16  # Open connections sending requests at the same time
+
+SAMPLE_DISTRICTS = ['COLOMBO', 'GAMPAHA', 'KANDY', 'GALLE', 'JAFFNA', 'KURUNEGALA', 'BADULLA', 'MATARA']
+SAMPLE_FIELDS = ['COMPUTER SCIENCE', 'MEDICINE', 'ENGINEERING', 'MANAGEMENT', 'LAW', 'ARTS *', 'NURSING']
+
+# ----------------------------------------------------------------------
+
+
+def random_student(rng):
+    """Returns one random /recommend request body."""
+    return {
+        'z_score': round(rng.uniform(0.5, 2.5), 4),
+        'district': rng.choice(SAMPLE_DISTRICTS),
+        'primary_field': rng.choice(SAMPLE_FIELDS),
+        'secondary_field': rng.choice(SAMPLE_FIELDS),
+        'stream': rng.choice(list(STREAM_COURSE_MAP)),
+    }
+
+
+async def post_json(reader, writer, host, path, payload):
+    """Sends one POST over an open keep-alive connection and returns the HTTP status."""
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    content_length = 0
+    while True:
+        header_line = await reader.readline()
+        if header_line in (b'\r\n', b''):
+            break
+        name, _, value = header_line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+    await reader.readexactly(content_length)
+    return status
+
+
+async def run_load_test(host, port, requests, concurrency, batch_size, seed=0):
+    """
+    Sends 'requests' requests over 'concurrency' connections and returns the
+    latencies (seconds), the failed request count and the wall-clock time.
+    """
+    rng = random.Random(seed)
+    if batch_size:
+        path = '/recommend/batch'
+        payloads = [{'students': [random_student(rng) for _ in range(batch_size)]} for _ in range(requests)]
+    else:
+        path = '/recommend'
+        payloads = [random_student(rng) for _ in range(requests)]
+
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    latencies, failures = [], 0
+
+    async def client():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while not queue.empty():
+                payload = queue.get_nowait()
+                start = time.perf_counter()
+                status = await post_json(reader, writer, host, path, payload)
+                latencies.append(time.perf_counter() - start)
+                failures += status != 200
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """Returns the value below which 'fraction' of the sorted values fall."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for recommendation_service.py.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help="Students per request; uses /recommend/batch when set.")
+    args = parser.parse_args()
+
+    latencies, failures, elapsed = asyncio.run(
+        run_load_test(args.host, args.port, args.requests, args.concurrency, args.batch_size)
+    )
+
+    print(f"Requests:    {len(latencies)} ({failures} failed) over {args.concurrency} connections")
+    print(f"Throughput:  {len(latencies) / elapsed:.1f} requests/s")
+    print(f"Latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"Latency p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"Latency avg: {statistics.mean(latencies) * 1000:.2f} ms")
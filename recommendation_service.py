@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from recommendation_system import (
+    load_data, recommend_batch, calculate_multi_preference_score, CutoffIndex, RecommendationCache,
+    ZSCORE_DATA_FILES, CUTOFF_ESTIMATES,
+    get_process_profiler, profile_stages, PROFILE_ENV_VAR
+)
+
+# ----------------------------------------------------------------------
+# SERVICE CONFIGURATION
+# ----------------------------------------------------------------------
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8000
+SERVICE_WORKERS = 2  # Worker processes that run the CPU-bound scoring
+MAX_BODY_BYTES = 10 * 1024 * 1024  # Largest accepted request body (batch rosters)
+
+# JSON fields of one student (the same names as calculate_compatibility_score's arguments)
+STUDENT_FIELDS = ['z_score', 'district', 'primary_field', 'secondary_field', 'stream']
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+# ----------------------------------------------------------------------
+
+# Cutoff data of this process: loaded once, before the first request it scores
+_service_data = {'df_cutoffs': None, 'cutoff_index': None, 'result_cache': RecommendationCache(candidate_lists=True)}
+
+
+def init_worker(file_paths):
+    """
+    Loads the averaged cutoff table and its CutoffIndex into this process.
+    Runs in the server before the worker pool starts (forked workers inherit
+    the data) and as the pool initializer (spawned workers load it once).
+    """
+    if _service_data['df_cutoffs'] is None:
+        df_cutoffs = load_data(file_paths)
+        if df_cutoffs is not None:
+            _service_data['cutoff_index'] = CutoffIndex(df_cutoffs)
+            _service_data['df_cutoffs'] = df_cutoffs
+
+
+def _z_score(value):
+    """Returns a request's z_score: a finite JSON number (not a string, a bool, NaN or infinity)."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+        raise ValueError("'z_score' must be a finite number.")
+    return float(value)
+
+
+def _student_arguments(student):
+    """
+    Validates one student's JSON object and returns the keyword arguments for
+    calculate_compatibility_score. Raises ValueError with a client message.
+    """
+    if not isinstance(student, dict):
+        raise ValueError("Each student must be a JSON object.")
+    for field in STUDENT_FIELDS:
+        if field not in student:
+            raise ValueError(f"Missing field '{field}'.")
+
+    z_score = _z_score(student['z_score'])
+
+    return {
+        'student_z_score': z_score,
+        'district': str(student['district']),
+        'primary_field': str(student['primary_field'] or ''),
+        'secondary_field': str(student['secondary_field'] or ''),
+        'stream': str(student['stream']),
+    }
+
+
+def _multi_preference_arguments(request):
+    """
+    Validates a multi-preference request (z_score, stream, a list of
+    districts, an ordered list of preference_fields and optional
+    boost_weights) and returns the keyword arguments for
+    calculate_multi_preference_score. Raises ValueError with a client message.
+    """
+    for field in ['z_score', 'districts', 'preference_fields', 'stream']:
+        if field not in request:
+            raise ValueError(f"Missing field '{field}'.")
+
+    z_score = _z_score(request['z_score'])
+
+    districts, preference_fields = request['districts'], request['preference_fields']
+    if not isinstance(districts, list) or not districts:
+        raise ValueError("'districts' must be a non-empty list.")
+    if not isinstance(preference_fields, list):
+        raise ValueError("'preference_fields' must be a list.")
+
+    boost_weights = request.get('boost_weights')
+    if boost_weights is not None:
+        if not isinstance(boost_weights, list) or len(boost_weights) != len(preference_fields) or \
+                not all(isinstance(weight, (int, float)) and not isinstance(weight, bool) for weight in boost_weights):
+            raise ValueError("'boost_weights' must be a list of numbers, one per preference field.")
+
+    return {
+        'student_z_score': z_score,
+        'districts': [str(district) for district in districts],
+        'preference_fields': [str(field or '') for field in preference_fields],
+        'stream': str(request['stream']),
+        'boost_weights': boost_weights,
+    }
+
+
+def _top_k(request):
+    """Returns the requested number of recommendations (None = the default)."""
+    k = request.get('k')
+    # bool is an int subclass, but "k": true is not a count
+    if k is not None and (not isinstance(k, int) or isinstance(k, bool) or k < 0):
+        raise ValueError("'k' must be a non-negative integer.")
+    return k
+
+
+def _cutoff_estimate(request):
+    """Returns the requested cutoff estimate, a CUTOFF_ESTIMATES key (None = the default)."""
+    cutoff_estimate = request.get('cutoff_estimate')
+    if cutoff_estimate is not None and (not isinstance(cutoff_estimate, str) or cutoff_estimate not in CUTOFF_ESTIMATES):
+        raise ValueError(f"'cutoff_estimate' must be one of: {', '.join(CUTOFF_ESTIMATES)}.")
+    return cutoff_estimate
+
+
+def score_student(arguments, k):
+    """Worker task: scores one student and returns the recommendations as JSON-ready records."""
+    recommendations = _service_data['result_cache'].recommend(
+        df_cutoffs=_service_data['df_cutoffs'], cutoff_index=_service_data['cutoff_index'], k=k, **arguments
+    )
+    return recommendations.to_dict('records')
+
+
+def score_multi_preference(arguments, k):
+    """Worker task: one multi-preference, multi-district query as JSON-ready records."""
+    recommendations = calculate_multi_preference_score(
+        df_cutoffs=_service_data['df_cutoffs'], cutoff_index=_service_data['cutoff_index'], k=k, **arguments
+    )
+    return recommendations.to_dict('records')
+
+
+def score_roster(students, k, cutoff_estimate=None):
+    """Worker task: scores a roster (list of argument dicts with a student_id) in one batch."""
+    roster = pd.DataFrame({
+        'Student_ID': [student['student_id'] for student in students],
+        'Z_Score': [student['student_z_score'] for student in students],
+        'District': [student['district'] for student in students],
+        'Primary_Field': [student['primary_field'] for student in students],
+        'Secondary_Field': [student['secondary_field'] for student in students],
+        'Stream': [student['stream'] for student in students],
+    })
+    recommendations = recommend_batch(
+        roster, _service_data['df_cutoffs'], k=k, cutoff_index=_service_data['cutoff_index'],
+        cutoff_estimate=cutoff_estimate
+    )
+    return recommendations.to_dict('records')
+
+
+def run_profiled(task, *args):
+    """
+    Runs a worker task and returns (result, stage records). The records are
+    only collected when profiling is on (PROFILE_ENV_VAR), for /metrics.
+    """
+    if get_process_profiler() is None:
+        return task(*args), []
+    with profile_stages() as profiler:
+        result = task(*args)
+    return result, list(profiler.records)
+
+
+class RecommendationService:
+    """
+    Minimal asyncio HTTP/1.1 server around the recommender.
+
+    Endpoints (JSON in, JSON out):
+      GET  /health            -> {"status": "ok", "cutoff_entries": n}
+      GET  /metrics           -> per-stage timings (when PROFILE_ENV_VAR is set)
+      POST /recommend         -> one student (STUDENT_FIELDS, optional "k" and "cutoff_estimate")
+      POST /recommend/batch   -> {"students": [...], "k": optional, "cutoff_estimate": optional}
+      POST /recommend/multi   -> ranked "preference_fields" over several "districts" (optional "boost_weights")
+    Connections are handled concurrently on the event loop and the scoring
+    runs in a process pool, so slow requests never block the loop.
+    """
+
+    def __init__(self, file_paths=ZSCORE_DATA_FILES, workers=SERVICE_WORKERS):
+        init_worker(file_paths)
+        # Also receives the stage records of the workers (None unless profiling is on)
+        self.profiler = get_process_profiler()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(file_paths,))
+        self.routes = {
+            '/recommend': self.recommend,
+            '/recommend/batch': self.recommend_batch,
+            '/recommend/multi': self.recommend_multi,
+        }
+
+    async def recommend(self, request):
+        arguments = _student_arguments(request)
+        arguments['cutoff_estimate'] = _cutoff_estimate(request)
+        k = _top_k(request)
+        return await self.run_in_worker(score_student, arguments, k)
+
+    async def recommend_multi(self, request):
+        arguments = _multi_preference_arguments(request)
+        arguments['cutoff_estimate'] = _cutoff_estimate(request)
+        k = _top_k(request)
+        return await self.run_in_worker(score_multi_preference, arguments, k)
+
+    async def recommend_batch(self, request):
+        students = request.get('students')
+        if not isinstance(students, list):
+            raise ValueError("'students' must be a list.")
+        k = _top_k(request)
+        cutoff_estimate = _cutoff_estimate(request)
+
+        roster = []
+        for position, student in enumerate(students):
+            arguments = _student_arguments(student)
+            arguments['student_id'] = student.get('student_id', position)
+            roster.append(arguments)
+
+        return await self.run_in_worker(score_roster, roster, k, cutoff_estimate)
+
+    async def run_in_worker(self, task, *args):
+        """Runs a scoring task in the process pool and keeps its stage records."""
+        result, records = await asyncio.get_running_loop().run_in_executor(self.executor, run_profiled, task, *args)
+        for record in records:
+            self.profiler.add(record)
+        return result
+
+    async def dispatch(self, method, path, body):
+        """Returns (status, payload) for one request."""
+        if path == '/health':
+            if _service_data['df_cutoffs'] is None:
+                return 503, {'status': 'no data'}
+            return 200, {'status': 'ok', 'cutoff_entries': len(_service_data['df_cutoffs'])}
+        if path == '/metrics':
+            if self.profiler is None:
+                return 404, {'error': f"Profiling is off; set {PROFILE_ENV_VAR}=1 to enable it."}
+            return 200, {'stages': self.profiler.metrics()}
+
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, {'error': f"Unknown path '{path}'."}
+        if method != 'POST':
+            return 405, {'error': "Use POST."}
+        if _service_data['df_cutoffs'] is None:
+            return 503, {'error': "Cutoff data is not loaded."}
+
+        try:
+            request = json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("The request body must be a JSON object.")
+            return 200, {'recommendations': await handler(request)}
+        except ValueError as error:  # Includes malformed JSON
+            return 400, {'error': str(error)}
+
+    async def handle_connection(self, reader, writer):
+        """Serves the requests of one (keep-alive) connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header_line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                content_length = int(headers.get('content-length', 0))
+                if content_length > MAX_BODY_BYTES:
+                    status, payload = 413, {'error': "Request body too large."}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(content_length)
+                    try:
+                        status, payload = await self.dispatch(method, path.split('?', 1)[0], body)
+                    except Exception as error:
+                        status, payload = 500, {'error': f"{type(error).__name__}: {error}"}
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+
+                response_body = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(response_body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + response_body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Client went away or sent something that is not HTTP
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Serves requests until cancelled."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Recommendation service listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON recommendation service.")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS, help="Scoring worker processes.")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(RecommendationService(workers=args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,17 @@
 import pandas as pd
 import numpy as np
+import argparse
+import contextlib
+import hashlib
+import itertools
 import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from collections import OrderedDict, deque
 
 # ----------------------------------------------------------------------
 # CONFIGURATION AND TUNABLE WEIGHTS (Parameters you can change easily)
@@ -12,14 +23,64 @@ ZSCORE_DATA_FILES = [
     'final_zscore_data_new_01.csv' # 2024-2025
 ]
 RECOMMENDATION_COUNT = 10 
+RECOMMENDATION_COLUMNS = ['Course', 'University', 'Z_Score', 'District', 'Compatibility_Score', 'Safety_Margin']
+ADMISSION_COLUMNS = ['Course', 'University', 'Z_Score', 'District', 'Admission_Probability', 'Safety_Margin']
+
+# Roster columns for batch recommendations (one row per student)
+BATCH_STUDENT_COLUMNS = ['Z_Score', 'District', 'Primary_Field', 'Secondary_Field', 'Stream']
+BATCH_CHUNK_SIZE = 2048  # Students scored per matrix block (bounds memory)
+
+# On-disk cache of the averaged cutoff table (set to None to disable).
+# Cache files are keyed on the path, size and modification time of every
+# data file, so editing or replacing a CSV rebuilds the cache automatically.
+CUTOFF_CACHE_DIR = '.zscore_cache'
+CUTOFF_CACHE_VERSION = 5  # Bump when the cached table layout (or how a column is computed) changes
+
+# Result cache (RecommendationCache): entries kept before the least recently used is dropped
+RESULT_CACHE_SIZE = 4096
+
+# Rows read per chunk when streaming the data files
+LOAD_CHUNK_SIZE = 50000
+# Worker processes for parsing the data files in parallel (1 = serial). Parallel loads
+# trade memory for speed: they hold every row of the files at once (see load_cutoff_accumulator)
+LOAD_WORKERS = 1
+
+# Shared cutoff table (publish_shared_table): one process publishes at a time; a publish
+# lock older than this many seconds was left by a crashed publisher and is taken over
+SHARED_PUBLISH_LOCK_TIMEOUT = 300
+
+# Per-stage timing of load_data and the scoring calls (off by default, see profile_stages).
+# Set this environment variable to 1 to profile every call in the process.
+PROFILE_ENV_VAR = 'ZSCORE_PROFILE'
+PROFILE_HISTORY = 100  # Most recent stage records kept by a StageProfiler
 
 # 1. Z-SCORE MARGIN WEIGHTS
 MAX_ZSCORE_MARGIN_CAP = 0.2 
 
+# Cutoff estimate the student's Z-Score is compared against (a key of CUTOFF_ESTIMATES)
+CUTOFF_ESTIMATE = 'mean'
+CUTOFF_ESTIMATES = {
+    'mean': 'Z_Score',                # Average over every year
+    'weighted': 'Z_Score_Weighted',   # Recency-weighted average (see RECENCY_DECAY)
+    'projected': 'Z_Score_Projected', # Linear trend over the years, extended to next year
+    'max': 'Z_Score_Max',             # Highest yearly cutoff (cautious)
+    'min': 'Z_Score_Min',             # Lowest yearly cutoff (optimistic)
+}
+RECENCY_DECAY = 0.5  # Weight of each year relative to the year after it
+
+# Admission chance (admission_chances): next year's cutoff is taken as normally distributed
+# around the cutoff estimate, with the spread of the course's yearly cutoffs pooled with a prior
+ADMISSION_PRIOR_SPREAD = 0.07  # Typical year-to-year std. deviation of a cutoff (median over the data)
+ADMISSION_PRIOR_WEIGHT = 1.0  # Years of evidence the prior counts as (one-year courses get the prior)
+ADMISSION_MIN_PROBABILITY = 0.05  # Less likely courses are left out; near misses above it are kept
+
 # 2. PREFERENCE BOOST SCORES
 PRIMARY_BOOST_VALUE = 1.0 
 SECONDARY_BOOST_VALUE = 0.5 
 BASE_BOOST_VALUE = 0.1 
+# Multi-preference queries (calculate_multi_preference_score): the 3rd preference onwards
+# gets this fraction of the boost of the preference before it (never below the base boost)
+PREFERENCE_RANK_DECAY = 0.8
 
 # 3. OVERALL WEIGHTS (Must sum to 1.0)
 WEIGHT_MARGIN = 0.5 
@@ -36,141 +97,1974 @@ STREAM_COURSE_MAP = {
     # Note: 'Mathamatics' stream is often broadly categorized into Physical Science courses.
 }
 
+# Preference fields offered in the web app. Which courses contain which field
+# is precomputed once per CutoffIndex (literal, case-insensitive substrings).
+PREFERENCE_FIELD_OPTIONS = ['MEDICINE', 'DENTAL SURGERY', 'VETERINARY SCIENCE', 'BIOCHEMISTRY & MOLECULAR BIOLOGY', 'AGRICULTURAL TECHNOLOGY & MANAGEMENT', 'AGRICULTURE', 'FOOD SCIENCE & NUTRITION', 'FOOD SCIENCE & TECHNOLOGY', 'BIOLOGICAL SCIENCE', 'APPLIED SCIENCES (BIO.SC)', 'ENGINEERING', 'ENGINEERING (EM)', 'ENGINEERING (TM)', 'QUANTITY SURVEYING', 'COMPUTER SCIENCE', 'PHYSICAL SCIENCE', 'SURVEYING SCIENCE', 'APPLIED SCIENCES (PHY.SC)', 'MANAGEMENT', 'REAL ESTATE MANAGEMENT & VALUATION', 'COMMERCE', 'MANAGEMENT AND PUBLIC POLICY', 'BUSINESS INFORMATION SYSTEMS', 'FINANCIAL ENGINEERING', 'BANKING & INSURANCE', 'SERVICE MANAGEMENT', 'LAW', 'ARTS *', 'ARTS (SP) / MASS MEDIA* #', 'ARTS (SP) / PERFORMING ARTS * #','ACCOUNTING INFORMATION SYSTEMS', 'AGRICULTURAL RESOURCE MANAGEMENT AND', 'AGRICULTURAL TECHNOLOGY & MANAGEMENT', 'AGRICULTURE', 'AGRI BUSINESS MANAGEMENT', 'ANIMAL PRODUCTION AND FOOD TECHNOLOGY', 'ANIMAL SCIENCE & FISHERIES', 'APPLIED CHEMISTRY', 'APPLIED SCIENCES (BIO.SC)', 'APPLIED SCIENCES (PHY.SC)', 'AQUATIC BIORESOURCES', 'ARABIC LANGUAGE *', 'ARCHITECTURE #', 'ARTS *', 'ARTS (SAB) - A * [ARTS STREAM]', 'ARTS (SAB) - B * [COMMERCE STREAM]', 'ARTS (SP) / MASS MEDIA* #', 'ARTS (SP) / PERFORMING ARTS * #', 'ARTS-INFORMATION TECHNOLOGY *', 'ARTIFICIAL INTELLIGENCE', 'AYURVEDA MEDICINE & SURGERY', 'BANKING & INSURANCE', 'BIOCHEMISTRY & MOLECULAR BIOLOGY', 'BIOLOGICAL SCIENCE', 'BIOMEDICAL TECHNOLOGY', 'BUSINESS INFORMATION SYSTEMS', 'BUSINESS SCIENCE', 'COMMERCE', 'COMMUNICATION STUDIES *', 'COMPUTER SCIENCE', 'COMPUTER SCIENCE & TECHNOLOGY', 'CREATIVE MUSIC TECHNOLOGY & PRODUCTION', 'DATA SCIENCE', 'DENTAL SURGERY', 'DESIGN #', 'ELECTRONICS AND COMPUTER SCIENCE', 'ENGINEERING', 'ENGINEERING (EM)', 'ENGINEERING (TM)', 'ENTREPRENEURSHIP AND MANAGEMENT', 'ENVIRONMENTAL CONSERVATION &', 'EXPORT AGRICULTURE', 'FACILITIES MANAGEMENT', 'FASHION DESIGN & PRODUCT DEVELOPMENT #', 'FINANCIAL ECONOMICS', 'FINANCIAL ENGINEERING', 'FINANCIAL MATHEMATICS AND INDUSTRIAL STATISTICS', 'FISHERIES & MARINE SCIENCES', 'FOOD BUSINESS MANAGEMENT', 'FOOD PRODUCTION', 'FOOD SCIENCE & NUTRITION', 'FOOD SCIENCE & TECHNOLOGY', 'GEOGRAPHICAL INFORMATION SCIENCE', 'GREEN TECHNOLOGY', 'HEALTH INFORMATION AND COMMUNICATION', 'HEALTH PROMOTION', 'HEALTH TOURISM AND HOSPITALITY MANAGEMENT', 'HUMAN RESOURCE DEVELOPMENT', 'INDIGENOUS MEDICINAL RESOURCES', 'INDIGENOUS PHARMACEUTICAL TECHNOLOGY', 'INDUSTRIAL INFORMATION', 'INDUSTRIAL STATISTICS &', 'INFORMATION AND COMMUNICATION TECHNOLOGY', 'INFORMATION SYSTEMS', 'INFORMATION TECHNOLOGY (IT)', 'INFORMATION TECHNOLOGY & MANAGEMENT', 'ISLAMIC STUDIES *', 'LANDSCAPE ARCHITECTURE #', 'LAW', 'MANAGEMENT', 'MANAGEMENT AND INFORMATION', 'MANAGEMENT AND PUBLIC POLICY', 'MANAGEMENT STUDIES (TV) - A', 'MANAGEMENT STUDIES (TV) - B', 'MARINE AND FRESHWATER SCIENCES', 'MEDICAL IMAGING TECHNOLOGY', 'MEDICAL LABORATORY SCIENCES', 'MEDICINE', 'MINERAL RESOURCES AND', 'NURSING', 'OCCUPATIONAL THERAPY', 'OPTOMETRY', 'PEACE & CONFLICT RESOLUTION *', 'PHARMACY', 'PHYSICAL EDUCATION #', 'PHYSICAL SCIENCE', 'PHYSIOTHERAPY', 'PRIMARY EDUCATION', 'QUANTITY SURVEYING', 'RADIOGRAPHY', 'REAL ESTATE MANAGEMENT & VALUATION', 'SCIENCE AND TECHNOLOGY', 'SERVICE MANAGEMENT', 'SIDDHA MEDICINE & SURGERY', 'SOCIAL STUDIES IN INDIGENOUS KNOWLEDGE', 'SOCIAL WORK *', 'SOFTWARE ENGINEERING', 'SPEECH AND HEARING SCIENCES', 'SPORTS SCIENCE & MANAGEMENT #', 'STATISTICS & OPERATIONS RESEARCH', 'SURVEYING SCIENCE', 'TOURISM & HOSPITALITY MANAGEMENT', 'UNANI MEDICINE & SURGERY', 'URBAN BIORESOURCES', 'URBAN INFORMATICS AND PLANNING', 'VETERINARY SCIENCE', 'YOGA AND PARAPSYCHOLOGY','AQUATIC RESOURCES TECHNOLOGY', 'HOSPITALITY, TOURISM', 'ENGLISH LANGUAGE & APPLIED LINGUISTICS', 'PLANTATION MANAGEMENT AND TECHNOLOGY', 'POLYMER SCIENCE AND INDUSTRIAL MANAGEMENT', 'ENGINEERING TECHNOLOGY (ET)', 'BIOSYSTEMS TECHNOLOGY (BST)', 'INFORMATION COMMUNICATION TECHNOLOGY', 'PHYSICAL SCIENCE -ICT', 'TRANSLATION STUDIES', 'FILM & TELEVISION STUDIES #', 'PROJECT MANAGEMENT', 'TEACHING ENGLISH AS A SECOND', 'VISUAL ARTS', 'MUSIC #', 'DANCE', 'DRAMA & THEATRE #', 'ART & DESIGN', 'VISUAL & TECHNOLOGICAL ARTS']
+
 # ----------------------------------------------------------------------
 
 
-def load_data(file_paths):
+class StageProfile:
     """
-    Loads Z-Score data from multiple years, consolidates it, and 
-    calculates the average Z-Score cutoff for each course.
+    Stage timings and row counts of one instrumented call.
+
+    The call ends each stage with lap(); a stage lasts from the previous lap
+    (or the start) to this one. Only created while profiling is on.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}  # Stage name -> milliseconds, in execution order
+        self.counts = {}  # e.g. 'after_stream_filter' -> rows left
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage, **counts):
+        """Ends 'stage' and records any row counts passed as keywords."""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last) * 1000
+        self._last = now
+        self.counts.update(counts)
+
+    def to_dict(self):
+        """The record as plain JSON-ready values."""
+        return {
+            'name': self.name,
+            'total_ms': (self._last - self._start) * 1000,
+            'stages_ms': dict(self.stages),
+            'counts': dict(self.counts),
+        }
+
+
+class StageProfiler:
+    """
+    Collects the records (StageProfile.to_dict()) of profiled calls: the most
+    recent ones in 'records', and per-call, per-stage totals in metrics().
+    Thread-safe, so one profiler can serve a whole process.
+    """
+
+    def __init__(self, history=PROFILE_HISTORY):
+        self.records = deque(maxlen=history)
+        self._totals = {}  # Call name -> {'calls': n, 'stages': {stage: [runs, total_ms, max_ms]}}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Adds one record (a StageProfile.to_dict() result)."""
+        with self._lock:
+            self.records.append(record)
+            totals = self._totals.setdefault(record['name'], {'calls': 0, 'stages': {}})
+            totals['calls'] += 1
+            for stage, ms in list(record['stages_ms'].items()) + [('total', record['total_ms'])]:
+                stage_totals = totals['stages'].setdefault(stage, [0, 0.0, 0.0])
+                stage_totals[0] += 1
+                stage_totals[1] += ms
+                stage_totals[2] = max(stage_totals[2], ms)
+
+    def metrics(self):
+        """
+        Returns {call name: {'calls': n, 'stages': {stage: {'runs', 'total_ms',
+        'mean_ms', 'max_ms'}}}}. A stage can run in fewer calls than its call
+        (e.g. no filtering on a cache hit); 'total' is the whole call.
+        """
+        with self._lock:
+            return {
+                name: {
+                    'calls': totals['calls'],
+                    'stages': {
+                        stage: {'runs': runs, 'total_ms': total_ms, 'mean_ms': total_ms / runs, 'max_ms': max_ms}
+                        for stage, (runs, total_ms, max_ms) in totals['stages'].items()
+                    },
+                }
+                for name, totals in self._totals.items()
+            }
+
+    def clear(self):
+        """Drops every record and total."""
+        with self._lock:
+            self.records.clear()
+            self._totals.clear()
+
+
+# Process-wide profiler, only when PROFILE_ENV_VAR is set; profile_stages() adds per-thread ones
+_process_profiler = StageProfiler() if os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0') else None
+_thread_profilers = threading.local()
+
+
+def get_process_profiler():
+    """Returns the process-wide StageProfiler, or None unless PROFILE_ENV_VAR is set."""
+    return _process_profiler
+
+
+def profiling_enabled():
+    """Returns True if calls made by this thread are profiled."""
+    return _process_profiler is not None or bool(getattr(_thread_profilers, 'active', None))
+
+
+@contextlib.contextmanager
+def profile_stages(profiler=None):
+    """
+    Profiles every instrumented call this thread makes inside the block and
+    yields the StageProfiler that receives the records:
+
+        with profile_stages() as profiler:
+            calculate_compatibility_score(...)
+        print(profiler.records[-1])
+    """
+    profiler = StageProfiler() if profiler is None else profiler
+    active = getattr(_thread_profilers, 'active', None)
+    if active is None:
+        active = _thread_profilers.active = []
+    active.append(profiler)
+    try:
+        yield profiler
+    finally:
+        active.remove(profiler)
+
+
+def _start_profile(name):
+    """Returns a new StageProfile, or None when profiling is off (the near-free path)."""
+    if _process_profiler is None and not getattr(_thread_profilers, 'active', None):
+        return None
+    return StageProfile(name)
+
+
+def _finish_profile(profile):
+    """Hands a finished StageProfile (or None) to every active profiler."""
+    if profile is None:
+        return
+    record = profile.to_dict()
+    if _process_profiler is not None:
+        _process_profiler.add(record)
+    for profiler in getattr(_thread_profilers, 'active', ()):
+        profiler.add(record)
+
+
+def _cutoff_cache_path(file_paths):
+    """
+    Returns the cache file for the averaged table of file_paths, or None if
+    a data file is missing. The file name is a hash of every input file's
+    path, size and modification time.
+    """
+    signature = hashlib.sha1(f'v{CUTOFF_CACHE_VERSION}'.encode())
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        signature.update(f'|{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+
+    return os.path.join(CUTOFF_CACHE_DIR, f'cutoffs-{signature.hexdigest()}.npz')
+
+
+def _table_to_arrays(df_cutoffs):
+    """
+    Converts the averaged cutoff table into plain NumPy arrays: integer codes
+    plus a string dictionary for every text column, and the numeric columns.
+    """
+    arrays = {'index': df_cutoffs.index.to_numpy()}
+    for col in CUTOFF_VALUE_COLUMNS:
+        arrays[col] = df_cutoffs[col].to_numpy()
+    for col in ['Course', 'University', 'District']:
+        values = _as_categorical(df_cutoffs[col])
+        arrays[f'{col}_codes'] = values.codes
+        arrays[f'{col}_names'] = np.asarray(values.categories, dtype=str)
+    return arrays
+
+
+def _arrays_to_table(arrays):
+    """Rebuilds the averaged cutoff table from the output of _table_to_arrays."""
+    columns = {}
+    for col in ['Course', 'University', 'District']:
+        names = pd.Index(arrays[f'{col}_names'], dtype='str')
+        codes = arrays[f'{col}_codes']
+        # Validating the codes copies them; memory-mapped codes were validated when published
+        columns[col] = pd.Categorical.from_codes(codes, categories=names, validate=not isinstance(codes, np.memmap))
+    for col in CUTOFF_VALUE_COLUMNS:
+        columns[col] = np.asarray(arrays[col])
+    # copy=False keeps memory-mapped arrays (see attach_shared_table) zero-copy
+    return pd.DataFrame(columns, copy=False).set_axis(pd.Index(arrays['index'], copy=False))
+
+
+def _read_cutoff_cache(cache_path):
+    """
+    Returns the cached averaged table, or None if there is no usable cache.
+    A corrupt cache file (truncated, empty, wrong layout) is removed, so the
+    table is rebuilt and cached again.
+    """
+    try:
+        with np.load(cache_path) as arrays:
+            return _arrays_to_table(arrays)
+    except OSError:
+        return None
+    except (zipfile.BadZipFile, EOFError, KeyError, ValueError) as error:
+        print(f"Warning: Removing the unreadable cutoff cache '{cache_path}': {error}")
+        with contextlib.suppress(OSError):
+            os.remove(cache_path)
+        return None
+
+
+def _write_cutoff_cache(cache_path, df_cutoffs):
+    """
+    Writes the averaged table to cache_path (atomically, so concurrent
+    processes never read a half-written file) and removes stale caches.
+    Caching is best effort: a read-only directory only costs the speed-up.
+    """
+    tmp_path = None
+    try:
+        os.makedirs(CUTOFF_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CUTOFF_CACHE_DIR, suffix='.tmp', delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+            np.savez(tmp_file, **_table_to_arrays(df_cutoffs))
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+
+        for file_name in os.listdir(CUTOFF_CACHE_DIR):
+            stale_path = os.path.join(CUTOFF_CACHE_DIR, file_name)
+            if file_name.startswith('cutoffs-') and stale_path != cache_path:
+                os.remove(stale_path)
+    except OSError as error:
+        print(f"Warning: Could not write the cutoff cache '{cache_path}': {error}")
+    finally:
+        # A failed write (e.g. a full disk) leaves no partial file behind
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+
+# Columns every Z-Score data file must have
+REQUIRED_COLUMNS = ['Course', 'University', 'District', 'Z_Score']
+GROUP_KEYS = ['Course', 'University', 'District']
+# Numeric columns of the averaged table, after GROUP_KEYS (see CutoffAccumulator.to_frame)
+CUTOFF_VALUE_COLUMNS = ['Z_Score', 'Z_Score_Weighted', 'Z_Score_Min', 'Z_Score_Max', 'Z_Score_Projected',
+                        'Z_Score_Trend', 'Z_Score_Std', 'Year_Count']
+
+
+def _chunk_keys(chunk):
+    """Returns the (Course, University, District) tuple of every row; missing names become None."""
+    key_columns = [chunk[col].to_numpy(dtype=object, na_value=None) for col in GROUP_KEYS]
+    return list(zip(*key_columns))
+
+
+def _assign_key_ids(key_ids, keys):
+    """
+    Returns the id of every key tuple in 'keys', as an array. Keys missing
+    from the key_ids dict are added with the next ids, in order of first
+    appearance. Every key is looked up at once; only keys seen for the
+    first time need a Python loop.
+    """
+    ids = list(map(key_ids.get, keys))
+    for row, key_id in enumerate(ids):
+        if key_id is None:
+            ids[row] = key_ids.setdefault(keys[row], len(key_ids))
+    return np.array(ids, dtype=np.intp)
+
+
+def _parse_data_file(file_path, chunk_size):
+    """
+    Parses one data file for a parallel load (runs in a worker process).
+    Returns (missing_column, parsed_file). parsed_file is (keys, key_index,
+    values): the distinct keys in first-seen order, the key of every row
+    as an index into keys, and the Z-Scores. If the file lacks one of the
+    REQUIRED_COLUMNS, missing_column names it and parsed_file is None.
+
+    Every row is kept (about 16 bytes each, plus the keys): the Kahan sums
+    are carried over from the earlier files, so the rows cannot be summed
+    here without changing the result.
+    """
+    key_ids = {}
+    key_index_parts = [np.zeros(0, dtype=np.intp)]
+    value_parts = [np.zeros(0)]
+
+    with pd.read_csv(file_path, chunksize=chunk_size or LOAD_CHUNK_SIZE) as reader:
+        for chunk in reader:
+            for col in REQUIRED_COLUMNS:
+                if col not in chunk.columns:
+                    return col, None
+            key_index_parts.append(_assign_key_ids(key_ids, _chunk_keys(chunk)))
+            value_parts.append(chunk['Z_Score'].to_numpy(dtype=float))
+
+    return None, (list(key_ids), np.concatenate(key_index_parts), np.concatenate(value_parts))
+
+
+def _parse_files_in_parallel(file_paths, chunk_size, workers):
+    """
+    Parses the data files in a pool of worker processes. Returns the results
+    of _parse_data_file in file order, or None if no process pool can be
+    started here (the caller then loads serially).
+    """
+    # Imported here: multiprocessing is only needed for parallel loads
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+            return list(executor.map(_parse_data_file, file_paths, [chunk_size] * len(file_paths)))
+    except (OSError, NotImplementedError, BrokenProcessPool) as error:
+        print(f"Warning: Parallel loading unavailable ({error}); loading the data files one by one.")
+        return None
+
+
+class CutoffAccumulator:
+    """
+    Running Z-Score sums and counts per (Course, University, District) key.
+
+    Data files are added chunk by chunk, so memory is bounded by the number
+    of distinct keys (times the number of years), never by the number of
+    rows read (except for parallel loads, see load_cutoff_accumulator). Sums use the same compensated (Kahan) summation as pandas'
+    groupby mean, so the averages are identical to averaging all files
+    concatenated in memory. Per-year sums and counts are kept too (see
+    year_frame), so a year can be dropped again without re-reading the
+    other files (see drop_year).
+    """
+
+    def __init__(self):
+        self.key_ids = {}  # (Course, University, District) -> key id, in first-seen order
+        self.rows_read = 0
+        self.year_labels = []
+        self._first_rows = np.zeros(0, dtype=np.int64)
+        self._sums = np.zeros(0)
+        self._compensation = np.zeros(0)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._year_sums = []
+        self._year_counts = []
+        self._year_first_rows = []  # Per year: the first row number of every key in that year (-1 = absent)
+        self._year_rows = []  # Per year: [first row number, rows read]
+
+    def copy(self):
+        """Returns an independent copy (keys are immutable tuples, so only containers are copied)."""
+        other = CutoffAccumulator()
+        other.key_ids = dict(self.key_ids)
+        other.rows_read = self.rows_read
+        other.year_labels = list(self.year_labels)
+        other._first_rows = self._first_rows.copy()
+        other._sums = self._sums.copy()
+        other._compensation = self._compensation.copy()
+        other._counts = self._counts.copy()
+        other._year_sums = [year_sums.copy() for year_sums in self._year_sums]
+        other._year_counts = [year_counts.copy() for year_counts in self._year_counts]
+        other._year_first_rows = [year_first_rows.copy() for year_first_rows in self._year_first_rows]
+        other._year_rows = [list(rows) for rows in self._year_rows]
+        return other
+
+    def _grow(self, key_count):
+        """Makes room in every per-key array for key_count keys."""
+        capacity = len(self._sums)
+        if key_count <= capacity:
+            return
+        capacity = max(key_count, 2 * capacity)
+
+        def grown(array, fill=0):
+            bigger = np.full(capacity, fill, dtype=array.dtype)
+            bigger[:len(array)] = array
+            return bigger
+
+        self._first_rows = grown(self._first_rows, -1)
+        self._sums = grown(self._sums)
+        self._compensation = grown(self._compensation)
+        self._counts = grown(self._counts)
+        self._year_sums = [grown(year_sums) for year_sums in self._year_sums]
+        self._year_counts = [grown(year_counts) for year_counts in self._year_counts]
+        self._year_first_rows = [grown(year_first_rows, -1) for year_first_rows in self._year_first_rows]
+
+    def _kahan_add(self, ids, values):
+        """Adds values[i] to the compensated sum of key ids[i]; ids must be unique."""
+        y = values - self._compensation[ids]
+        t = self._sums[ids] + y
+        compensation = t - self._sums[ids] - y
+        # An infinite value makes the compensation NaN; pandas resets it to 0
+        compensation[np.isnan(compensation)] = 0
+        self._compensation[ids] = compensation
+        self._sums[ids] = t
+
+    def add_chunk(self, chunk, year_label):
+        """Adds the rows of one DataFrame chunk (with REQUIRED_COLUMNS) to the running sums."""
+        self._add_rows(_chunk_keys(chunk), None, chunk['Z_Score'].to_numpy(dtype=float), year_label)
+
+    def add_parsed(self, parsed_file, year_label):
+        """Adds a whole file parsed by _parse_data_file (keys, key_index, values)."""
+        keys, key_index, values = parsed_file
+        self._add_rows(keys, key_index, values, year_label)
+
+    def _add_rows(self, keys, key_index, values, year_label):
+        """
+        Adds rows to the running sums, in row order. Row i has key
+        keys[key_index[i]] (keys[i] if key_index is None) and Z-Score values[i].
+        The rows of one year must be added one after another.
+        """
+        if year_label not in self.year_labels:
+            self.year_labels.append(year_label)
+            self._year_sums.append(np.zeros(len(self._sums)))
+            self._year_counts.append(np.zeros(len(self._sums), dtype=np.int64))
+            self._year_first_rows.append(np.full(len(self._sums), -1, dtype=np.int64))
+            self._year_rows.append([self.rows_read, 0])
+        year = self.year_labels.index(year_label)
+
+        known_keys = len(self.key_ids)
+        key_ids = _assign_key_ids(self.key_ids, keys)
+        if key_index is not None:
+            key_ids = key_ids[key_index]
+        self._grow(len(self.key_ids))
+
+        # New keys get increasing ids in order of first appearance
+        new_ids, first_positions = np.unique(key_ids[key_ids >= known_keys], return_index=True)
+        self._first_rows[new_ids] = self.rows_read + np.flatnonzero(key_ids >= known_keys)[first_positions]
+
+        # Same for the keys new to this year
+        year_first_rows = self._year_first_rows[year]
+        new_in_year = year_first_rows[key_ids] < 0
+        new_ids, first_positions = np.unique(key_ids[new_in_year], return_index=True)
+        year_first_rows[new_ids] = self.rows_read + np.flatnonzero(new_in_year)[first_positions]
+
+        self.rows_read += len(key_ids)
+        self._year_rows[year][1] += len(key_ids)
+
+        has_value = ~np.isnan(values)
+        key_ids, values = key_ids[has_value], values[has_value]
+
+        # A key repeated inside the rows is summed in row order, one occurrence per pass
+        if len(np.unique(key_ids)) == len(key_ids):
+            passes = [np.ones(len(key_ids), dtype=bool)]
+        else:
+            occurrence = pd.Series(key_ids).groupby(key_ids).cumcount().to_numpy()
+            passes = [occurrence == n for n in range(occurrence.max() + 1)]
+
+        for in_pass in passes:
+            ids, vals = key_ids[in_pass], values[in_pass]
+            self._kahan_add(ids, vals)
+            self._counts[ids] += 1
+            self._year_sums[year][ids] += vals
+            self._year_counts[year][ids] += 1
+
+    def add_file(self, file_path, chunk_size=None, year_label=None):
+        """
+        Streams one data file into the accumulator in chunks of chunk_size
+        rows (default LOAD_CHUNK_SIZE). Returns False if the file lacks one
+        of the REQUIRED_COLUMNS.
+        """
+        with pd.read_csv(file_path, chunksize=chunk_size or LOAD_CHUNK_SIZE) as reader:
+            for chunk in reader:
+                for col in REQUIRED_COLUMNS:
+                    if col not in chunk.columns:
+                        print(f"Warning: Column '{col}' not found in one of the data files. Cannot proceed.")
+                        return False
+                self.add_chunk(chunk, year_label or file_path)
+        return True
+
+    def drop_year(self, year_label):
+        """
+        Removes the rows of one year (its year label, the data file path by
+        default) in time proportional to the number of keys: no file is read.
+        Keys only found in that year disappear and the remaining keys and row
+        numbers are those of a fresh load of the other years. The sums are
+        rebuilt from the per-year sums in year order, which is exactly the
+        fresh-load result unless a key repeats within one year (then they can
+        differ in the last bit). Returns False if the year was never added.
+        """
+        if year_label not in self.year_labels:
+            return False
+        year = self.year_labels.index(year_label)
+        year_start, year_rows = self._year_rows[year]
+        for per_year in (self.year_labels, self._year_sums, self._year_counts, self._year_first_rows, self._year_rows):
+            del per_year[year]
+
+        # Later rows move up by the dropped year's rows
+        self.rows_read -= year_rows
+        for rows in self._year_rows:
+            if rows[0] > year_start:
+                rows[0] -= year_rows
+        for year_first_rows in self._year_first_rows:
+            year_first_rows[year_first_rows > year_start] -= year_rows
+
+        # Each key's first row in the remaining years, or -1 if it only appeared in the dropped year
+        key_count = len(self.key_ids)
+        first_rows = np.full(key_count, -1, dtype=np.int64)
+        for year_first_rows in self._year_first_rows:
+            year_first_rows = year_first_rows[:key_count]
+            earlier = (year_first_rows >= 0) & ((first_rows < 0) | (year_first_rows < first_rows))
+            first_rows[earlier] = year_first_rows[earlier]
+
+        # Renumber the surviving keys in first-seen order
+        kept = np.flatnonzero(first_rows >= 0)
+        kept = kept[np.argsort(first_rows[kept], kind='stable')]
+        keys = list(self.key_ids)
+        self.key_ids = {keys[old_id]: new_id for new_id, old_id in enumerate(kept)}
+        self._first_rows = first_rows[kept]
+        self._year_sums = [year_sums[kept] for year_sums in self._year_sums]
+        self._year_counts = [year_counts[kept] for year_counts in self._year_counts]
+        self._year_first_rows = [year_first_rows[kept] for year_first_rows in self._year_first_rows]
+
+        # Replay the remaining years into the compensated sums
+        self._sums = np.zeros(len(kept))
+        self._compensation = np.zeros(len(kept))
+        self._counts = np.zeros(len(kept), dtype=np.int64)
+        for year_sums, year_counts in zip(self._year_sums, self._year_counts):
+            ids = np.flatnonzero(year_counts > 0)
+            self._kahan_add(ids, year_sums[ids])
+            self._counts[ids] += year_counts[ids]
+        return True
+
+    def _keys_frame(self):
+        """Returns the key columns, one row per key, indexed by first-seen row number."""
+        keys = list(self.key_ids)
+        frame = pd.DataFrame(
+            {col: pd.Series([key[i] for key in keys], dtype='str') for i, col in enumerate(GROUP_KEYS)}
+        )
+        return frame.set_axis(pd.Index(self._first_rows[:len(keys)]))
+
+    def _key_is_complete(self):
+        """Boolean array: True for keys without a missing Course, University or District."""
+        return np.fromiter((None not in key for key in self.key_ids), dtype=bool, count=len(self.key_ids))
+
+    def to_frame(self):
+        """
+        Returns the averaged table: one row per key, in first-seen order, with
+        the mean Z_Score over every row read and the per-year statistics
+        (CUTOFF_VALUE_COLUMNS). Keys with a missing name get no average, like
+        pandas' groupby.
+        """
+        key_count = len(self.key_ids)
+        frame = self._keys_frame()
+        is_complete = self._key_is_complete()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z_scores = self._sums[:key_count] / self._counts[:key_count]
+        frame['Z_Score'] = np.where(is_complete, z_scores, np.nan)
+        for col, values in self._year_statistics().items():
+            frame[col] = np.where(is_complete, values, 0 if col == 'Year_Count' else np.nan)
+        return frame
+
+    def _year_statistics(self):
+        """
+        Per-key statistics of the yearly averages, computed together from the
+        (keys x years) matrix of per-year sums and counts. Years are in the
+        order they were added (oldest first); a key's missing years are left
+        out of every statistic.
+        """
+        key_count = len(self.key_ids)
+        year_count = len(self.year_labels)
+        counts = np.array([year_counts[:key_count] for year_counts in self._year_counts]).reshape(year_count, key_count).T
+        sums = np.array([year_sums[:key_count] for year_sums in self._year_sums]).reshape(year_count, key_count).T
+        present = counts > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            year_means = np.where(present, sums / np.maximum(counts, 1), np.nan)
+        years_present = present.sum(axis=1)
+
+        # Recency weights: the latest year 1, the one before RECENCY_DECAY, ...
+        weights = np.where(present, RECENCY_DECAY ** np.arange(year_count - 1, -1, -1, dtype=float), 0.0)
+        filled_means = np.where(present, year_means, 0.0)
+
+        # Least-squares line through the yearly averages (year number -> Z-Score)
+        years = np.where(present, np.arange(year_count, dtype=float), 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weighted = (weights * filled_means).sum(axis=1) / weights.sum(axis=1)
+            year_mean = years.sum(axis=1) / years_present
+            z_mean = filled_means.sum(axis=1) / years_present
+            year_offsets = np.where(present, years - year_mean[:, None], 0.0)
+            slope = (year_offsets * (filled_means - z_mean[:, None])).sum(axis=1) / (year_offsets ** 2).sum(axis=1)
+            # Sample standard deviation of the yearly averages (NaN with a single year)
+            squared_deviations = np.where(present, (filled_means - z_mean[:, None]) ** 2, 0.0)
+            std = np.sqrt(squared_deviations.sum(axis=1) / (years_present - 1))
+        slope = np.where(years_present > 1, slope, np.where(years_present == 1, 0.0, np.nan))
+        std = np.where(years_present > 1, std, np.nan)
+
+        return {
+            'Z_Score_Weighted': weighted,
+            # NaN for a key without any Z-Score (not +/-inf, which would pass every cutoff check)
+            'Z_Score_Min': np.where(years_present > 0, np.min(year_means, axis=1, initial=np.inf, where=present), np.nan),
+            'Z_Score_Max': np.where(years_present > 0, np.max(year_means, axis=1, initial=-np.inf, where=present), np.nan),
+            'Z_Score_Projected': z_mean + slope * (year_count - year_mean),
+            'Z_Score_Trend': slope,
+            'Z_Score_Std': std,
+            'Year_Count': years_present,
+        }
+
+    def year_frame(self):
+        """
+        Returns the per-year averages: one row per key and one Z-Score column
+        per year label (the data file path by default), NaN where the key does
+        not appear in that year.
+        """
+        key_count = len(self.key_ids)
+        frame = self._keys_frame()
+        for label, year_sums, year_counts in zip(self.year_labels, self._year_sums, self._year_counts):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                frame[label] = year_sums[:key_count] / year_counts[:key_count]
+        return frame
+
+
+def load_cutoff_accumulator(file_paths, chunk_size=None, workers=None, accumulator=None):
+    """
+    Streams every data file into a CutoffAccumulator, one chunk at a time,
+    so memory is bounded by the number of distinct keys. With workers > 1
+    (default LOAD_WORKERS) the files are parsed in parallel worker
+    processes and merged in file order, which gives the same result as the
+    serial load but not the same memory bound: each worker holds a whole
+    file's rows (key index and Z-Score, about 16 bytes per row), and all
+    files' rows are in this process until they are merged, so peak memory
+    grows with the total number of rows. Pass an accumulator to add the files
+    to it (as later years) instead of a new one. Returns None (after
+    printing the reason) if a file is missing or lacks a required column.
     """
-    all_years_df = []
-    
     for file_path in file_paths:
         if not os.path.exists(file_path):
             print(f"Error: Data file '{file_path}' not found. Please ensure all data files are present.")
             return None
-        
-        df = pd.read_csv(file_path)
-        all_years_df.append(df)
-    
-    # Combine all data into a single DataFrame
-    combined_df = pd.concat(all_years_df, ignore_index=True)
-    
-    # ⚠️ FIX STEP 1: Keep ONLY the required columns before grouping
-    required_cols = ['Course', 'University', 'District', 'Z_Score']
-    
-    for col in required_cols:
-        if col not in combined_df.columns:
-            print(f"Warning: Column '{col}' not found in one of the data files. Cannot proceed.")
+
+    if accumulator is None:
+        accumulator = CutoffAccumulator()
+
+    workers = LOAD_WORKERS if workers is None else workers
+    parsed_files = None
+    if workers > 1 and len(file_paths) > 1:
+        parsed_files = _parse_files_in_parallel(file_paths, chunk_size, workers)
+
+    if parsed_files is not None:
+        for file_path, (missing_column, parsed_file) in zip(file_paths, parsed_files):
+            if missing_column is not None:
+                print(f"Warning: Column '{missing_column}' not found in one of the data files. Cannot proceed.")
+                return None
+            accumulator.add_parsed(parsed_file, file_path)
+        return accumulator
+
+    for file_path in file_paths:
+        if not accumulator.add_file(file_path, chunk_size=chunk_size):
             return None # Error if critical columns are missing
+
+    return accumulator
+
+
+def _compact_table(final_avg_df):
+    """
+    Compact representation of the averaged table (in place): every repeated
+    name is stored once and rows hold small integer codes. District names are
+    upper-cased here, once.
+    """
+    final_avg_df['District'] = final_avg_df['District'].str.upper()
+    for col in ['Course', 'University', 'District']:
+        final_avg_df[col] = final_avg_df[col].astype('category')
+
+
+def load_data(file_paths, use_cache=True, workers=None):
+    """
+    Loads Z-Score data from multiple years, consolidates it, and 
+    calculates the average Z-Score cutoff for each course.
+    The files are streamed in chunks, or parsed in parallel with workers > 1
+    (see load_cutoff_accumulator).
+    The averaged table is cached on disk (see CUTOFF_CACHE_DIR), so later
+    loads of unchanged files skip the CSV parsing and averaging.
+    Course, University and District are returned as categoricals, with
+    District names in upper case.
+    """
+    profile = _start_profile('load_data')
+
+    cache_path = None
+    if use_cache and CUTOFF_CACHE_DIR:
+        cache_path = _cutoff_cache_path(file_paths)
+        if cache_path is not None and os.path.exists(cache_path):
+            df_cached = _read_cutoff_cache(cache_path)
+            if df_cached is not None:
+                if profile is not None:
+                    profile.lap('cache_read', cutoff_entries=len(df_cached))
+                _finish_profile(profile)
+                return df_cached
+        if profile is not None:
+            profile.lap('cache_read')
+
+    accumulator = load_cutoff_accumulator(file_paths, workers=workers)
+    if accumulator is None:
+        _finish_profile(profile)
+        return None
+    if profile is not None:
+        profile.lap('parse', files=len(file_paths), rows_read=accumulator.rows_read)
+
+    # One row per unique (Course, University, District) with its average Z_Score
+    final_avg_df = accumulator.to_frame()
+    if profile is not None:
+        profile.lap('average', cutoff_entries=len(final_avg_df))
+
+    _compact_table(final_avg_df)
+    if profile is not None:
+        profile.lap('categorize')
+
+    if cache_path is not None:
+        _write_cutoff_cache(cache_path, final_avg_df)
+        if profile is not None:
+            profile.lap('cache_write')
+
+    _finish_profile(profile)
+    return final_avg_df
     
-    combined_df = combined_df[required_cols].copy() 
-    
-    # Key columns for identifying a unique cutoff entry
-    group_keys = ['Course', 'University', 'District']
-    
-    # Calculate the average Z_Score 
-    combined_df['Avg_Z_Score'] = combined_df.groupby(group_keys)['Z_Score'].transform('mean')
-    
-    # Keep only one row per unique entry
-    final_avg_df = combined_df.drop_duplicates(subset=group_keys, keep='first').copy()
-    
-    # ⚠️ FIX STEP 2: Drop the original 'Z_Score' column before renaming 'Avg_Z_Score'
-    if 'Z_Score' in final_avg_df.columns:
-        final_avg_df.drop(columns=['Z_Score'], inplace=True)
-        
-    # Rename the calculated average column
-    final_avg_df.rename(columns={'Avg_Z_Score': 'Z_Score'}, inplace=True)
-    
-    # Keep only the necessary columns
-    return final_avg_df[['Course', 'University', 'District', 'Z_Score']].copy()
-    
 
-def calculate_compatibility_score(student_z_score, district, primary_field, secondary_field, stream, df_cutoffs):
+def _as_categorical(values):
+    """Returns the values of a Series as a pandas Categorical (no copy if already one)."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.array
+    return pd.Categorical(values)
+
+
+class PreferenceMatcher:
+    """
+    Literal, case-insensitive substring matcher between course names and
+    preference fields. Membership of every course in every field of
+    PREFERENCE_FIELD_OPTIONS is precomputed as a boolean course x field
+    matrix, so matching a known field is a column lookup. Fields outside
+    the vocabulary fall back to a literal scan of the distinct course names.
+    """
+
+    def __init__(self, course_names, fields=PREFERENCE_FIELD_OPTIONS):
+        self._names = [name.lower() if isinstance(name, str) else '' for name in course_names]
+
+        self.field_columns = {}
+        for field in fields:
+            self.field_columns.setdefault(field.lower(), len(self.field_columns))
+
+        self.membership = np.zeros((len(self._names), len(self.field_columns)), dtype=bool)
+        for field, column in self.field_columns.items():
+            self.membership[:, column] = [field in name for name in self._names]
+
+    def match(self, field):
+        """Returns a boolean array, per course code, of courses whose name contains field."""
+        field = field.lower()
+        column = self.field_columns.get(field)
+        if column is not None:
+            return self.membership[:, column]
+        return np.array([field in name for name in self._names], dtype=bool)
+
+    def match_many(self, fields):
+        """
+        Returns a boolean (course code x field) matrix for a list of fields:
+        the membership columns of the known fields, taken in one step, and a
+        literal scan only for fields outside the vocabulary.
+        """
+        fields = [field.lower() for field in fields]
+        columns = [self.field_columns.get(field, -1) for field in fields]
+        matches = self.membership[:, columns]
+        for position, column in enumerate(columns):
+            if column < 0:
+                matches[:, position] = self.match(fields[position])
+        return matches
+
+
+def _erf(x):
+    """
+    Vectorized error function (Abramowitz & Stegun 7.1.26, absolute error
+    below 1.5e-7), so the normal CDF needs no SciPy.
+    """
+    x = np.asarray(x, dtype=float)
+    t = 1 / (1 + 0.3275911 * np.abs(x))
+    polynomial = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return np.sign(x) * (1 - polynomial * np.exp(-x * x))
+
+
+def _admission_spread(df_cutoffs):
+    """
+    Standard deviation of next year's cutoff for every table row: the variance
+    of the course's yearly cutoffs (Z_Score_Std, with Year_Count - 1 degrees
+    of freedom) pooled with ADMISSION_PRIOR_SPREAD, which counts as
+    ADMISSION_PRIOR_WEIGHT years. Tables without yearly statistics get the prior.
+    """
+    if 'Z_Score_Std' not in df_cutoffs or 'Year_Count' not in df_cutoffs:
+        return np.full(len(df_cutoffs), ADMISSION_PRIOR_SPREAD)
+    dof = np.maximum(df_cutoffs['Year_Count'].to_numpy(dtype=float) - 1, 0)
+    variance = np.nan_to_num(df_cutoffs['Z_Score_Std'].to_numpy(dtype=float) ** 2)
+    pooled_variance = (dof * variance + ADMISSION_PRIOR_WEIGHT * ADMISSION_PRIOR_SPREAD ** 2) / (dof + ADMISSION_PRIOR_WEIGHT)
+    return np.sqrt(pooled_variance)
+
+
+_CUTOFF_INDEX_VERSIONS = itertools.count(1)
+
+
+class CutoffIndex:
+    """
+    Pre-filtered view of the averaged cutoff table, built once after load_data.
+
+    Every (stream, district) pair is mapped to a ready-made slice of the table
+    that already has the stream keyword filter and the district filter applied,
+    sorted by cutoff Z-Score. A query then only touches the rows that can
+    matter for that student instead of scanning the whole table.
+
+    The cutoff is the table column of cutoff_estimate (see CUTOFF_ESTIMATES),
+    presented as 'Z_Score' in 'table' and in every slice.
+    """
+
+    def __init__(self, df_cutoffs, cutoff_estimate=None):
+        # Data-version stamp: a new index (e.g. after a reload) never shares cached results
+        self.version = next(_CUTOFF_INDEX_VERSIONS)
+
+        self.cutoff_estimate = CUTOFF_ESTIMATE if cutoff_estimate is None else cutoff_estimate
+        if self.cutoff_estimate not in CUTOFF_ESTIMATES:
+            raise ValueError(f"Unknown cutoff estimate '{self.cutoff_estimate}'. "
+                             f"Choose one of: {', '.join(CUTOFF_ESTIMATES)}.")
+        self.table = df_cutoffs[GROUP_KEYS + ['Z_Score']]
+        if CUTOFF_ESTIMATES[self.cutoff_estimate] != 'Z_Score':
+            self.table = self.table.assign(Z_Score=df_cutoffs[CUTOFF_ESTIMATES[self.cutoff_estimate]])
+
+        # String work is done once per distinct name; rows are handled as integer codes
+        courses = _as_categorical(df_cutoffs['Course'])
+        districts = _as_categorical(df_cutoffs['District'])
+        z_scores = self.table['Z_Score'].to_numpy(dtype=float)
+        self.z_scores = z_scores
+
+        # Result rows are built from plain arrays (see recommendation_frame): the index labels,
+        # and per text column the codes and the name of every code (code -1 picks the trailing None)
+        self.index_labels = df_cutoffs.index.to_numpy()
+        self._text_columns = {}
+        for col in GROUP_KEYS:
+            values = _as_categorical(df_cutoffs[col])
+            self._text_columns[col] = (values.codes, np.append(np.asarray(values.categories, dtype=object), None))
+        # One id per (Course, University) pair, for merging the rows of several districts
+        universities = _as_categorical(df_cutoffs['University'])
+        self.course_pair_ids = courses.codes.astype(np.int64) * (len(universities.categories) + 1) + universities.codes
+
+        # Admission chance model: 1 / (spread * sqrt(2)) per row, so a probability is one erf call
+        self.admission_scale = 1 / (_admission_spread(df_cutoffs) * np.sqrt(2))
+
+        # Code -1 (missing name) picks the trailing None / False entries
+        self.course_codes = courses.codes
+        self.preferences = PreferenceMatcher(list(courses.categories) + [None])
+
+        # Row positions of every district (upper-cased, like the old filter)
+        district_names = districts.categories.str.upper()
+        district_rows = {}
+        for code, rows in pd.Series(districts.codes).groupby(districts.codes, sort=False).indices.items():
+            if code >= 0:
+                district = district_names[code]
+                district_rows[district] = np.sort(np.concatenate([district_rows.get(district, []), rows]).astype(np.intp))
+        self.district_names = sorted(district_rows)
+
+        # Stream masks: None stands for "no stream filter" (unknown stream)
+        stream_masks = {None: np.ones(len(df_cutoffs), dtype=bool)}
+        for stream, keywords in STREAM_COURSE_MAP.items():
+            if keywords:
+                pattern = '|'.join(keywords)
+                category_mask = courses.categories.str.contains(pattern, case=False, na=False)
+                stream_masks[stream] = np.append(np.asarray(category_mask, dtype=bool), False)[courses.codes]
+
+        self.stream_row_counts = {stream: int(mask.sum()) for stream, mask in stream_masks.items()}
+        self.stream_has_courses = {stream: count > 0 for stream, count in self.stream_row_counts.items()}
+        self._slices = {}
+        self._slice_cutoffs = {}  # Contiguous cutoff array of every slice, for the scoring kernel
+
+        for stream, mask in stream_masks.items():
+            for district, rows in district_rows.items():
+                rows = rows[mask[rows]]
+                if len(rows) == 0:
+                    continue
+                # Sort by cutoff; equal cutoffs keep their table order
+                rows = rows[np.argsort(z_scores[rows], kind='stable')]
+                self._slices[(stream, district)] = (self.table.iloc[rows], rows)
+                self._slice_cutoffs[(stream, district)] = z_scores[rows]
+
+    def _stream_key(self, stream):
+        return stream if STREAM_COURSE_MAP.get(stream) else None
+
+    def has_stream(self, stream):
+        """Returns True if any course in the table matches the stream keywords."""
+        return self.stream_has_courses[self._stream_key(stream)]
+
+    def stream_row_count(self, stream):
+        """Returns the number of table rows that pass the stream keyword filter."""
+        return self.stream_row_counts[self._stream_key(stream)]
+
+    def lookup(self, stream, district):
+        """
+        Returns (candidates_df, table_rows) for a stream and district.
+        candidates_df is sorted by cutoff Z-Score and table_rows holds the
+        position of each candidate in the original table. Returns (None, None)
+        if no course matches.
+        """
+        return self._slices.get((self._stream_key(stream), district.upper()), (None, None))
+
+    def candidate_cutoffs(self, stream, district):
+        """Returns the cutoffs of the lookup() candidates as one contiguous array, or None."""
+        return self._slice_cutoffs.get((self._stream_key(stream), district.upper()))
+
+    def preference_boost(self, table_rows, primary_field, secondary_field):
+        """
+        Returns the preference boost of the courses at table_rows.
+        Every stream-eligible course gets the base boost, courses matching the
+        primary field get the primary boost and courses matching only the
+        secondary field get the secondary boost.
+        """
+        course_codes = self.course_codes[table_rows]
+        boost = np.full(len(course_codes), BASE_BOOST_VALUE)
+        primary_mask = np.zeros(len(course_codes), dtype=bool)
+
+        # Primary Field Match 
+        if primary_field:
+            primary_mask = self.preferences.match(primary_field)[course_codes]
+            boost[primary_mask] = PRIMARY_BOOST_VALUE
+
+        # Secondary Field Match 
+        if secondary_field and secondary_field.lower() != (primary_field or '').lower():
+            secondary_mask = self.preferences.match(secondary_field)[course_codes]
+            # Apply secondary boost only if it didn't get the primary boost
+            boost[~primary_mask & secondary_mask] = SECONDARY_BOOST_VALUE
+
+        return boost
+
+    def preference_boosts(self, table_rows, preference_fields, boost_weights):
+        """
+        Returns the preference boost of the courses at table_rows for an
+        ordered list of preference fields: a course gets the weight of the
+        first field it matches, or the base boost if it matches none. With
+        two fields weighted as the primary and secondary boosts this equals
+        preference_boost().
+        """
+        boost = np.full(len(table_rows), BASE_BOOST_VALUE)
+        if not preference_fields:
+            return boost
+
+        # (candidates x fields) from the precomputed course x field matrix, in one pass
+        matches = self.preferences.match_many(preference_fields)[self.course_codes[table_rows]]
+        matched = matches.any(axis=1)
+        first_match = matches.argmax(axis=1)
+        boost[matched] = np.asarray(boost_weights, dtype=float)[first_match[matched]]
+        return boost
+
+    def admission_probability(self, table_rows, cutoffs, student_z_score):
+        """
+        Returns, for the courses at table_rows with the given cutoffs, the
+        probability that next year's cutoff is at or below student_z_score
+        (normal CDF with each course's precomputed spread).
+        """
+        return 0.5 * (1 + _erf((student_z_score - cutoffs) * self.admission_scale[table_rows]))
+
+    def text_values(self, col, table_rows):
+        """Returns the Course, University or District names of the rows at table_rows as a string array."""
+        codes, names = self._text_columns[col]
+        return pd.array(names[codes[table_rows]], dtype='str')
+
+    def recommendation_frame(self, table_rows, compatibility_scores, safety_margins):
+        """
+        Builds the recommendation rows (RECOMMENDATION_COLUMNS, indexed by the
+        table's labels) of the courses at table_rows straight from the index's
+        arrays, with plain string text columns and rounded safety margins.
+        """
+        return pd.DataFrame({
+            'Course': self.text_values('Course', table_rows),
+            'University': self.text_values('University', table_rows),
+            'Z_Score': self.z_scores[table_rows],
+            'District': self.text_values('District', table_rows),
+            'Compatibility_Score': compatibility_scores,
+            'Safety_Margin': safety_margins.round(4),
+        }, index=pd.Index(self.index_labels[table_rows]))
+
+
+# Indexes built by get_cutoff_index, keyed on id() of the cutoff DataFrame
+_CUTOFF_INDEX_CACHE = {}
+
+
+def get_cutoff_index(df_cutoffs, cutoff_estimate=None):
+    """
+    Returns the CutoffIndex for df_cutoffs and a cutoff estimate (default
+    CUTOFF_ESTIMATE), building it on first use. The index is remembered for
+    as long as the DataFrame is alive, so only the first query after
+    load_data pays the build cost.
+    """
+    cutoff_estimate = CUTOFF_ESTIMATE if cutoff_estimate is None else cutoff_estimate
+    key = id(df_cutoffs)
+    cached = _CUTOFF_INDEX_CACHE.get(key)
+    if cached is None or cached[0]() is not df_cutoffs:
+        df_ref = weakref.ref(df_cutoffs, lambda _, key=key: _CUTOFF_INDEX_CACHE.pop(key, None))
+        cached = _CUTOFF_INDEX_CACHE[key] = (df_ref, {})
+
+    cutoff_index = cached[1].get(cutoff_estimate)
+    if cutoff_index is None:
+        cutoff_index = cached[1][cutoff_estimate] = CutoffIndex(df_cutoffs, cutoff_estimate)
+    return cutoff_index
+
+
+def _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate):
+    """Returns cutoff_index, or the memoized index of df_cutoffs if none is given or it uses another estimate."""
+    if cutoff_index is None or (cutoff_estimate is not None and cutoff_estimate != cutoff_index.cutoff_estimate):
+        return get_cutoff_index(df_cutoffs, cutoff_estimate)
+    return cutoff_index
+
+
+def _with_plain_strings(df):
+    """Converts the categorical text columns of a (small) result frame back to strings."""
+    for col in ['Course', 'University', 'District']:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('str')
+    return df
+
+
+@contextlib.contextmanager
+def _shared_publish_lock(shared_dir):
+    """
+    Holds the 'PUBLISH.lock' file of shared_dir (created with O_EXCL), so
+    only one process publishes at a time. Waits for a lock held by another
+    publisher; one older than SHARED_PUBLISH_LOCK_TIMEOUT is taken over.
+    """
+    lock_path = os.path.join(shared_dir, 'PUBLISH.lock')
+    token = f'{os.getpid()}-{time.time_ns()}'
+    while True:
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > SHARED_PUBLISH_LOCK_TIMEOUT:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue  # Released in the meantime
+            time.sleep(0.05)
+    with os.fdopen(lock_fd, 'w') as lock_file:
+        lock_file.write(token)
+
+    try:
+        yield
+    finally:
+        # Leaves the lock alone if it was taken over from us meanwhile
+        try:
+            with open(lock_path) as lock_file:
+                if lock_file.read() == token:
+                    os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def _shared_version_time(version):
+    """Returns the publish time (ns) in a 'table-<time>-<pid>' version name, or None."""
+    try:
+        return int(version.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def publish_shared_table(df_cutoffs, shared_dir, if_unpublished=False):
+    """
+    Publishes the averaged table to shared_dir for other processes to attach
+    to with SharedCutoffTable. Every array is written as an uncompressed
+    .npy file into a new version directory, then the 'CURRENT' pointer file
+    is swapped atomically, so readers see either the old or the new table,
+    never a mix. Publishers take turns (see _shared_publish_lock). The
+    version replaced by this one is kept for readers still attaching to it;
+    versions older than it are removed (open memory maps stay valid).
+    With if_unpublished=True nothing is written if a version is already
+    published. Returns the new (or already published) version name.
+    """
+    with _shared_publish_lock(shared_dir):
+        previous = _shared_table_version(shared_dir)
+        if if_unpublished and previous is not None:
+            return previous
+
+        version = f'table-{time.time_ns()}-{os.getpid()}'
+        version_dir = os.path.join(shared_dir, version)
+        os.makedirs(version_dir)
+
+        for name, array in _table_to_arrays(df_cutoffs).items():
+            np.save(os.path.join(version_dir, f'{name}.npy'), array)
+
+        pointer_tmp = os.path.join(shared_dir, f'CURRENT.{version}.tmp')
+        with open(pointer_tmp, 'w') as pointer_file:
+            pointer_file.write(version)
+        os.replace(pointer_tmp, os.path.join(shared_dir, 'CURRENT'))
+
+        previous_time = _shared_version_time(previous) if previous else None
+        if previous_time is not None:
+            for old_version in os.listdir(shared_dir):
+                old_time = _shared_version_time(old_version) if old_version.startswith('table-') else None
+                if old_time is not None and old_time < previous_time:
+                    shutil.rmtree(os.path.join(shared_dir, old_version), ignore_errors=True)
+
+    return version
+
+
+def _shared_table_version(shared_dir):
+    """Returns the currently published version name in shared_dir, or None."""
+    try:
+        with open(os.path.join(shared_dir, 'CURRENT')) as pointer_file:
+            return pointer_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def attach_shared_table(shared_dir, version=None):
+    """
+    Attaches to a table published with publish_shared_table. The numeric
+    columns, the categorical codes and the index are memory-mapped
+    read-only, so every process shares one copy in the OS page cache; only
+    the name dictionaries are copied. The CutoffIndex built on the table
+    (see SharedCutoffTable) is still per process. Returns the table, or
+    None if nothing is published (or the version was just replaced).
+    """
+    version = version or _shared_table_version(shared_dir)
+    if version is None:
+        return None
+
+    version_dir = os.path.join(shared_dir, version)
+    try:
+        arrays = {
+            file_name[:-len('.npy')]: np.load(os.path.join(version_dir, file_name), mmap_mode='r')
+            for file_name in os.listdir(version_dir) if file_name.endswith('.npy')
+        }
+        return _arrays_to_table(arrays)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class SharedCutoffTable:
+    """
+    A process's read-only view of the cutoff table published in shared_dir.
+
+    current() returns the (df_cutoffs, cutoff_index) pair of the latest
+    published version. When a new version is published, the next call
+    attaches to it and swaps both at once; callers holding the previous
+    pair keep a consistent (old) table until they ask again.
+    """
+
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+        self.version = None
+        self._current = (None, None)
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Returns (df_cutoffs, cutoff_index); (None, None) if nothing is published."""
+        version = _shared_table_version(self.shared_dir)
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    df_cutoffs = attach_shared_table(self.shared_dir, version)
+                    if df_cutoffs is not None:
+                        self._current = (df_cutoffs, CutoffIndex(df_cutoffs))
+                        self.version = version
+        return self._current
+
+
+def _file_signature(file_path):
+    """Returns (size, modification time) of a file, or None if it is missing."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class CutoffTableStore:
+    """
+    The averaged cutoff table of a running app, updated in place.
+
+    The first table comes from load_data, so a cold start reads the on-disk
+    cache instead of every CSV. The per-key running sums (a
+    CutoffAccumulator) are built from the kept files on the first change
+    and then stay in memory, so later syncs fold in a new year file, or
+    drop a year that left a rolling window, in time proportional to that
+    file alone. The new table and its CutoffIndex
+    are built on the side and swapped in as one pair: current() never waits,
+    and callers holding the previous pair keep a consistent (old) table.
+    An up-to-date sync() does not wait either, and sync(blocking=False)
+    returns at once while another caller is rebuilding.
+    """
+
+    def __init__(self, file_paths=None, workers=None):
+        self.workers = workers
+        # (file_paths, signatures) of the current table, replaced as one pair
+        self._synced = ([], {})
+        self._accumulator = None  # Built on the first change after the initial load
+        self._current = (None, None)
+        self._lock = threading.Lock()
+        if file_paths is not None:
+            self.sync(file_paths)
+
+    @property
+    def file_paths(self):
+        """The data files the current table averages, in order."""
+        return self._synced[0]
+
+    def current(self):
+        """Returns (df_cutoffs, cutoff_index); (None, None) before the first successful sync."""
+        return self._current
+
+    def sync(self, file_paths, blocking=True):
+        """
+        Makes the table the average of file_paths (in that order). Files that
+        are no longer listed, or that changed on disk, are dropped, and new
+        ones are added at the end; unchanged files are never re-read. Any
+        other change of order reloads every file. Returns True if the table
+        changed, False if it was already up to date or the load failed (the
+        current table is then kept). The up-to-date check takes no lock; with
+        blocking=False, a caller that finds another one rebuilding returns
+        False at once and keeps serving current().
+        """
+        file_paths = list(file_paths)
+        signatures = {file_path: _file_signature(file_path) for file_path in file_paths}
+        if (file_paths, signatures) == self._synced:
+            return False
+
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            synced_paths, synced_signatures = self._synced
+            # Another caller may have finished the same rebuild while we waited
+            if (file_paths, signatures) == self._synced:
+                return False
+            if not synced_paths:
+                return self._initial_load(file_paths, signatures)
+            profile = _start_profile('CutoffTableStore.sync')
+
+            kept = [file_path for file_path in synced_paths
+                    if file_path in signatures and signatures[file_path] == synced_signatures[file_path]]
+            if kept != file_paths[:len(kept)]:
+                kept = []
+            added = file_paths[len(kept):]
+
+            # Changes go to a copy, so a failed load leaves the current sums untouched
+            if not kept:
+                accumulator = CutoffAccumulator()
+            elif self._accumulator is None:
+                # First change since the initial load: the sums of the kept files are read once
+                accumulator = load_cutoff_accumulator(kept, workers=self.workers)
+                if accumulator is None:
+                    _finish_profile(profile)
+                    return False
+            else:
+                accumulator = self._accumulator.copy()
+                for file_path in synced_paths:
+                    if file_path not in kept:
+                        accumulator.drop_year(file_path)
+            if profile is not None:
+                profile.lap('drop', dropped=len(synced_paths) - len(kept))
+
+            if added and load_cutoff_accumulator(added, workers=self.workers, accumulator=accumulator) is None:
+                _finish_profile(profile)
+                return False
+            if profile is not None:
+                profile.lap('add', added=len(added))
+
+            df_cutoffs = accumulator.to_frame()
+            _compact_table(df_cutoffs)
+            cutoff_index = CutoffIndex(df_cutoffs)
+            if profile is not None:
+                profile.lap('rebuild', cutoff_entries=len(df_cutoffs))
+
+            self._accumulator = accumulator
+            self._current = (df_cutoffs, cutoff_index)
+            self._synced = (file_paths, signatures)
+            _finish_profile(profile)
+            return True
+        finally:
+            self._lock.release()
+
+    def _initial_load(self, file_paths, signatures):
+        """First sync (lock held): the table from load_data, normally its on-disk cache."""
+        df_cutoffs = load_data(file_paths, workers=self.workers)
+        if df_cutoffs is None:
+            return False
+        self._current = (df_cutoffs, CutoffIndex(df_cutoffs))
+        self._synced = (file_paths, signatures)
+        return True
+
+
+def rank_top_k(scores, k, tiebreak=None):
+    """
+    Ranking engine: returns the positions of the k highest scores, best first.
+
+    'scores' is a 1-D array, or a 2-D array ranked row by row. Equal scores
+    are ordered by ascending 'tiebreak' (one value per score column, default
+    the column position), so the result is deterministic. Only the top-k
+    candidates are selected with np.argpartition, and only those k are
+    sorted, instead of a full sort of every score.
+    """
+    scores = np.asarray(scores, dtype=float)
+    n = scores.shape[-1]
+    k = max(0, min(k, n))
+    if tiebreak is None:
+        tiebreak = np.arange(n)
+
+    if scores.ndim == 1:
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+        if k < n:
+            # Everything better than the k-th best score is in; ties at the
+            # k-th best score are taken by smallest tiebreak
+            kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            better = np.flatnonzero(scores > kth_score)
+            ties = np.flatnonzero(scores == kth_score)
+            needed = k - len(better)
+            if needed < len(ties):
+                ties = ties[np.argpartition(tiebreak[ties], needed - 1)[:needed]]
+            selected = np.concatenate([better, ties])
+        else:
+            selected = np.arange(n)
+        return selected[np.lexsort((tiebreak[selected], -scores[selected]))]
+
+    # 2-D: put the columns in tiebreak order, so "first tied column" is the tiebreak
+    column_order = np.argsort(tiebreak, kind='stable')
+    scores = scores[:, column_order]
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.intp)
+    if k < n:
+        kth_score = np.take_along_axis(scores, np.argpartition(-scores, k - 1, axis=1)[:, k - 1:k], axis=1)
+        ties = scores == kth_score
+        needed = k - (scores > kth_score).sum(axis=1, keepdims=True)
+        selected = (scores > kth_score) | (ties & (np.cumsum(ties, axis=1) <= needed))
+        # Exactly k columns per row, still in tiebreak order
+        selected = np.nonzero(selected)[1].reshape(len(scores), k)
+    else:
+        selected = np.broadcast_to(np.arange(n), scores.shape)
+    ranking = np.argsort(-np.take_along_axis(scores, selected, axis=1), axis=1, kind='stable')
+    return column_order[np.take_along_axis(selected, ranking, axis=1)]
+
+
+def _find_candidates(cutoff_index, stream, district, profile=None):
+    """
+    Steps 1-2 of calculate_compatibility_score: the stream- and district-
+    filtered candidates, sorted by cutoff, and their table positions.
+    Returns (None, None) after printing why if no course matches.
+    """
+    # 1. Stream Eligibility Filtering (precomputed in the CutoffIndex)
+    has_stream = cutoff_index.has_stream(stream)
+    if profile is not None:
+        profile.lap('stream_filter', after_stream_filter=cutoff_index.stream_row_count(stream))
+    if not has_stream:
+        # If no courses match the stream, return an empty DataFrame immediately
+        print(f"No courses found matching the '{stream}' stream criteria.")
+        return None, None
+
+    # 2. Filter by District: Find the cutoff for the student's district (e.g., 'COLOMBO')
+    candidates_df, table_rows = cutoff_index.lookup(stream, district)
+    if profile is not None:
+        profile.lap('district_filter', after_district_filter=0 if table_rows is None else len(table_rows))
+
+    if candidates_df is None:
+        print(f"Warning: No cutoff data found for district: {district} after Stream filtering.")
+    return candidates_df, table_rows
+
+
+class _ScoringBuffers(threading.local):
+    """
+    Output buffers of _score_kernel, one set per thread. They grow to the
+    largest candidate list seen and are reused by every later call, so
+    scoring a query allocates no per-step arrays.
+    """
+
+    def __init__(self):
+        self.size = -1  # Nothing allocated yet
+
+    def get(self, size):
+        """Returns (safety_margin, scores, weighted_boost) buffers of length size."""
+        if size > self.size:
+            self.size = max(size, 2 * self.size)
+            self.safety_margin = np.empty(self.size)
+            self.scores = np.empty(self.size)
+            self.weighted_boost = np.empty(self.size)
+        return self.safety_margin[:size], self.scores[:size], self.weighted_boost[:size]
+
+
+_scoring_buffers = _ScoringBuffers()
+
+
+def _eligible_count(cutoffs, student_z_score):
+    """
+    Number of candidates (sorted by cutoff) whose cutoff is at or below the
+    Z-Score: a binary search, except that a NaN Z-Score makes none eligible
+    (as cutoffs <= z does; the search would put NaN after every cutoff).
+    """
+    if np.isnan(student_z_score):
+        return 0
+    return np.searchsorted(cutoffs, student_z_score, side='right')
+
+
+def _score_kernel(cutoffs, boost, student_z_score):
+    """
+    Steps 3-5 of calculate_compatibility_score on plain NumPy arrays: the
+    candidates' cutoffs (sorted, contiguous) and preference boosts. Every
+    step writes into the calling thread's reusable buffers (ufuncs with
+    out=), with the same floating-point operations in the same order as
+    the DataFrame formulation. Returns (scores, safety_margin) of the
+    eligible candidates, a prefix of the input; both are views of the
+    buffers, valid until the thread's next call.
+    """
+    # 3. Z-Score Eligibility: the candidates are sorted by cutoff, so the eligible ones are a prefix
+    eligible_count = _eligible_count(cutoffs, student_z_score)
+    safety_margin, scores, weighted_boost = _scoring_buffers.get(eligible_count)
+
+    # Safety Margin, capped (only positive margins count) and normalized to 0 to 1
+    np.subtract(student_z_score, cutoffs[:eligible_count], out=safety_margin)
+    np.clip(safety_margin, 0, MAX_ZSCORE_MARGIN_CAP, out=scores)
+    np.divide(scores, MAX_ZSCORE_MARGIN_CAP, out=scores)
+
+    # 4-5. Weighted average of the normalized margin and the preference boost
+    np.multiply(scores, WEIGHT_MARGIN, out=scores)
+    np.multiply(boost[:eligible_count], WEIGHT_PREFERENCE, out=weighted_boost)
+    np.add(scores, weighted_boost, out=scores)
+    return scores, safety_margin
+
+
+def _score_candidates(cutoff_index, table_rows, cutoffs, boost, student_z_score, k, profile=None):
+    """
+    Steps 3-6 of calculate_compatibility_score: scores the candidates (their
+    table positions, cutoffs and preference boosts, sorted by cutoff) for one
+    Z-Score and returns the top k recommendations. Scoring and ranking run on
+    NumPy arrays; only the k result rows become a DataFrame.
+    """
+    scores, safety_margin = _score_kernel(cutoffs, boost, student_z_score)
+    if profile is not None:
+        profile.lap('scoring', eligible=len(scores))
+
+    # 6. Final Ranking (every course scored is eligible)
+    # Highest score first; equal scores keep their order in the cutoff table
+    ranking = rank_top_k(scores, k, tiebreak=table_rows[:len(scores)])
+    final_recommendations = cutoff_index.recommendation_frame(
+        table_rows[ranking], scores[ranking], safety_margin[ranking]
+    )
+    if profile is not None:
+        profile.lap('ranking', returned=len(final_recommendations))
+
+    return final_recommendations
+
+
+def calculate_compatibility_score(student_z_score, district, primary_field, secondary_field, stream, df_cutoffs,
+                                  cutoff_index=None, k=None, cutoff_estimate=None):
     """
     Calculates a compatibility score for all eligible courses based on 
     Z-Score margin (now using the average Z-Score) and student preferences.
+    Pass a prebuilt CutoffIndex as cutoff_index to skip the index lookup.
+    cutoff_estimate picks the cutoff to compare with (a CUTOFF_ESTIMATES
+    key, default the index's own, else CUTOFF_ESTIMATE); the result's
+    Z_Score column holds that cutoff.
+    Returns the top k courses (default RECOMMENDATION_COUNT).
     """
     if df_cutoffs is None:
         return pd.DataFrame()
 
-    eligible_df = df_cutoffs.copy()
-    
-    # 1. Stream Eligibility Filtering (NEW LOGIC)
-    
-    stream_keywords = STREAM_COURSE_MAP.get(stream, [])
-    
-    if stream_keywords:
-        # Create a regex pattern to search for any of the stream-relevant keywords
-        pattern = '|'.join(stream_keywords)
-        
-        # Filter the DataFrame to include only courses matching the student's stream keywords
-        stream_filter_mask = eligible_df['Course'].str.contains(pattern, case=False, na=False)
-        eligible_df = eligible_df[stream_filter_mask].copy()
-        
-    if eligible_df.empty:
-        # If no courses match the stream, return an empty DataFrame immediately
+    if k is None:
+        k = RECOMMENDATION_COUNT
+
+    profile = _start_profile('calculate_compatibility_score')
+
+    cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+    if profile is not None:
+        profile.lap('index_lookup')
+
+    candidates_df, table_rows = _find_candidates(cutoff_index, stream, district, profile)
+    if candidates_df is None:
+        _finish_profile(profile)
+        return pd.DataFrame()
+
+    cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+    boost = cutoff_index.preference_boost(table_rows, primary_field, secondary_field)
+    if profile is not None:
+        profile.lap('preference_match')
+
+    recommendations = _score_candidates(cutoff_index, table_rows, cutoffs, boost, student_z_score, k, profile)
+    _finish_profile(profile)
+    return recommendations
+
+
+def preference_boost_weights(count):
+    """
+    Default boosts of 'count' ordered preference fields: the primary and
+    secondary boosts, then PREFERENCE_RANK_DECAY times the boost before,
+    never below the base boost.
+    """
+    weights = [PRIMARY_BOOST_VALUE, SECONDARY_BOOST_VALUE][:count]
+    while len(weights) < count:
+        weights.append(max(weights[-1] * PREFERENCE_RANK_DECAY, BASE_BOOST_VALUE))
+    return weights
+
+
+def calculate_multi_preference_score(student_z_score, districts, preference_fields, stream, df_cutoffs,
+                                     boost_weights=None, cutoff_index=None, k=None, cutoff_estimate=None):
+    """
+    calculate_compatibility_score for an ordered list of preference fields
+    (boosted by boost_weights, default preference_boost_weights) and one or
+    more districts, in one query. Every field's matches come from one pass
+    over the precomputed course x field matrix and the candidates of all
+    districts are scored together. A course offered by the same university
+    in several districts appears once, with its best score (District tells
+    which cutoff it was compared with).
+    Returns the top k courses (default RECOMMENDATION_COUNT); with one
+    district and two fields this equals calculate_compatibility_score.
+    """
+    if df_cutoffs is None:
+        return pd.DataFrame()
+
+    if k is None:
+        k = RECOMMENDATION_COUNT
+    if isinstance(districts, str):
+        districts = [districts]
+    if boost_weights is None:
+        boost_weights = preference_boost_weights(len(preference_fields))
+    if len(boost_weights) != len(preference_fields):
+        raise ValueError("boost_weights must have one weight per preference field.")
+
+    # Empty fields match nothing, like an empty primary or secondary field
+    fields = [field for field in preference_fields if field]
+    weights = [weight for field, weight in zip(preference_fields, boost_weights) if field]
+
+    profile = _start_profile('calculate_multi_preference_score')
+
+    cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+    if profile is not None:
+        profile.lap('index_lookup')
+
+    # 1. Stream Eligibility Filtering (precomputed in the CutoffIndex)
+    if not cutoff_index.has_stream(stream):
         print(f"No courses found matching the '{stream}' stream criteria.")
+        _finish_profile(profile)
         return pd.DataFrame()
 
-    # 2. Filter by District: Find the cutoff for the student's district (e.g., 'COLOMBO')
-    district_cutoff_df = eligible_df[eligible_df['District'].str.upper() == district.upper()].copy()
+    # 2. District Filtering: the eligible prefix of every district's candidates (sorted by cutoff)
+    row_parts, cutoff_parts = [], []
+    for district in dict.fromkeys(district.upper() for district in districts):
+        _, table_rows = cutoff_index.lookup(stream, district)
+        if table_rows is None:
+            print(f"Warning: No cutoff data found for district: {district} after Stream filtering.")
+            continue
+        cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+        eligible_count = _eligible_count(cutoffs, student_z_score)
+        row_parts.append(table_rows[:eligible_count])
+        cutoff_parts.append(cutoffs[:eligible_count])
 
-    if district_cutoff_df.empty:
-        print(f"Warning: No cutoff data found for district: {district} after Stream filtering.")
+    if not row_parts:
+        _finish_profile(profile)
         return pd.DataFrame()
+    table_rows = np.concatenate(row_parts)
+    cutoffs = np.concatenate(cutoff_parts)
+    if profile is not None:
+        profile.lap('district_filter', districts=len(row_parts), eligible=len(table_rows))
+
+    # 4. Preference Boost of every field at once
+    boost = cutoff_index.preference_boosts(table_rows, fields, weights)
+    if profile is not None:
+        profile.lap('preference_match', fields=len(fields))
+
+    # 3, 5. Every cutoff left is at or below the Z-Score, so the kernel's eligible prefix is all of them
+    scores, safety_margin = _score_kernel(cutoffs, boost, student_z_score)
+    if profile is not None:
+        profile.lap('scoring')
+
+    # 6. Final Ranking: highest score first, equal scores in table order; then the first
+    # (best) row of every (course, university) pair, so each course appears once
+    order = np.lexsort((table_rows, -scores))
+    _, first_rows = np.unique(cutoff_index.course_pair_ids[table_rows[order]], return_index=True)
+    ranking = order[np.sort(first_rows)][:k]
+    recommendations = cutoff_index.recommendation_frame(table_rows[ranking], scores[ranking], safety_margin[ranking])
+    if profile is not None:
+        profile.lap('ranking', returned=len(recommendations))
+
+    _finish_profile(profile)
+    return recommendations
+
+
+def admission_chances(student_z_score, district, stream, df_cutoffs, cutoff_index=None, cutoff_estimate=None,
+                      min_probability=None):
+    """
+    Admission probability of every course of the student's stream and
+    district: P(next cutoff <= student_z_score), with the cutoff normally
+    distributed around the cutoff estimate (see ADMISSION_PRIOR_SPREAD).
+    Unlike the compatibility ranking this keeps the near misses, courses
+    just above the student's Z-Score that still have a chance.
+    Returns the courses with a probability of at least min_probability
+    (default ADMISSION_MIN_PROBABILITY), most likely first (ADMISSION_COLUMNS).
+    """
+    if df_cutoffs is None:
+        return pd.DataFrame()
+
+    if min_probability is None:
+        min_probability = ADMISSION_MIN_PROBABILITY
+
+    cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+    candidates_df, table_rows = _find_candidates(cutoff_index, stream, district)
+    if candidates_df is None:
+        return pd.DataFrame()
+
+    # One array operation over every candidate, eligible or not
+    cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+    probability = cutoff_index.admission_probability(table_rows, cutoffs, student_z_score)
+
+    # Most likely first; equal probabilities keep their order in the cutoff table
+    likely = np.flatnonzero(probability >= min_probability)
+    ranking = likely[rank_top_k(probability[likely], len(likely), tiebreak=table_rows[likely])]
+
+    chances_df = candidates_df.iloc[ranking][['Course', 'University', 'Z_Score', 'District']].copy()
+    chances_df['Admission_Probability'] = probability[ranking]
+    chances_df['Safety_Margin'] = (student_z_score - cutoffs[ranking]).round(4)
+    return _with_plain_strings(chances_df[ADMISSION_COLUMNS])
+
+
+class RecommendationCache:
+    """
+    Bounded, thread-safe LRU memoization of calculate_compatibility_score.
+
+    Entries are keyed on the normalised inputs (upper-case district, lower-
+    case preference fields) plus the CutoffIndex version, so a reloaded
+    table never serves stale results. With candidate_lists=True the cache
+    stores, per (district, stream, preferences), the candidate courses
+    sorted by cutoff with their preference boosts; any Z-Score is then
+    answered by a binary search for the eligible prefix instead of a
+    full lookup, and Z-Scores differing in the fourth decimal share one entry.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, candidate_lists=False):
+        self.maxsize = maxsize
+        self.candidate_lists = candidate_lists
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def recommend(self, student_z_score, district, primary_field, secondary_field, stream, df_cutoffs,
+                  cutoff_index=None, k=None, cutoff_estimate=None):
+        """Same arguments and result as calculate_compatibility_score, served from the cache when possible."""
+        if df_cutoffs is None:
+            return pd.DataFrame()
+        if k is None:
+            k = RECOMMENDATION_COUNT
+        # Every cutoff estimate has its own index, and so its own version in the key
+        cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+
+        primary_key = (primary_field or '').lower()
+        secondary_key = (secondary_field or '').lower()
+        if secondary_key == primary_key:
+            secondary_key = ''
+        query_key = (cutoff_index.version, district.upper(), cutoff_index._stream_key(stream), primary_key,
+                     secondary_key)
+        profile = _start_profile('RecommendationCache.recommend')
+
+        if not self.candidate_lists:
+            key = query_key + (float(student_z_score), k)
+            found, recommendations = self._get(key)
+            if profile is not None:
+                profile.lap('cache_lookup', cache_hit=int(found))
+            if not found:
+                # Profiled on its own as calculate_compatibility_score
+                recommendations = calculate_compatibility_score(
+                    student_z_score, district, primary_field, secondary_field, stream, df_cutoffs,
+                    cutoff_index=cutoff_index, k=k
+                )
+                self._put(key, recommendations)
+            # Callers may add columns to the result; keep the cached frame intact
+            recommendations = recommendations.copy()
+            if profile is not None:
+                profile.lap('calculate' if not found else 'copy', returned=len(recommendations))
+            _finish_profile(profile)
+            return recommendations
+
+        found, candidates = self._get(query_key)
+        if profile is not None:
+            profile.lap('cache_lookup', cache_hit=int(found))
+        if not found:
+            candidates_df, table_rows = _find_candidates(cutoff_index, stream, district, profile)
+            if candidates_df is not None:
+                cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+                boost = cutoff_index.preference_boost(table_rows, primary_field, secondary_field)
+                candidates = (table_rows, cutoffs, boost)
+                if profile is not None:
+                    profile.lap('preference_match')
+            self._put(query_key, candidates)
+
+        recommendations = pd.DataFrame() if candidates is None else \
+            _score_candidates(cutoff_index, *candidates, student_z_score, k, profile)
+        _finish_profile(profile)
+        return recommendations
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def clear(self):
+        """Drops every cached entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+def _score_matrix(z_scores, cutoffs, boost):
+    """
+    Steps 3-5 of calculate_compatibility_score for many Z-Scores at once.
+    Returns the (Z-Scores x candidates) compatibility scores, -inf where the
+    course is out of reach, and the matching safety margins.
+    """
+    z_scores = z_scores[:, None]
+    safety_margin = z_scores - cutoffs
+    margin_score = np.clip(safety_margin, 0, MAX_ZSCORE_MARGIN_CAP) / MAX_ZSCORE_MARGIN_CAP
+    scores = (margin_score * WEIGHT_MARGIN) + (boost * WEIGHT_PREFERENCE)
+    scores[~(cutoffs <= z_scores)] = -np.inf
+    return scores, safety_margin
+
+
+def _read_roster(students):
+    """
+    Returns the roster as a DataFrame indexed by student. 'students' may be a
+    DataFrame or the path of a roster CSV file. A 'Student_ID' column, if
+    present, becomes the index. Returns None if the roster cannot be used.
+    """
+    if isinstance(students, (str, os.PathLike)):
+        if not os.path.exists(students):
+            print(f"Error: Roster file '{students}' not found.")
+            return None
+        students = pd.read_csv(students)
+
+    for col in BATCH_STUDENT_COLUMNS:
+        if col not in students.columns:
+            print(f"Warning: Column '{col}' not found in the student roster. Cannot proceed.")
+            return None
+
+    if 'Student_ID' in students.columns:
+        students = students.set_index('Student_ID')
+    else:
+        students = students.rename_axis('Student_ID')
+
+    return students
+
+
+def recommend_batch(students_df, df_cutoffs, k=None, cutoff_index=None, cutoff_estimate=None):
+    """
+    Calculates the top-k recommendations for a whole roster of students.
+
+    students_df is a DataFrame (or the path of a roster CSV) with one row per
+    student and the columns in BATCH_STUDENT_COLUMNS. Students sharing a
+    stream, district and preference pair are scored together as a single
+    students x courses matrix, so there is no per-student Python loop.
+    Returns a long-format DataFrame with one row per (student, course),
+    ranked exactly like calculate_compatibility_score (same cutoff_estimate).
+    """
+    if k is None:
+        k = RECOMMENDATION_COUNT
+
+    result_columns = ['Student_ID', 'Rank'] + RECOMMENDATION_COLUMNS
+
+    students = _read_roster(students_df)
+    if students is None or df_cutoffs is None:
+        return pd.DataFrame(columns=result_columns)
+
+    profile = _start_profile('recommend_batch')
+
+    cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+
+    # Students with the same candidate courses and preference boosts form one group
+    group_keys = pd.DataFrame({
+        'Stream': students['Stream'].fillna('').astype(str),
+        'District': students['District'].fillna('').astype(str).str.upper(),
+        'Primary_Field': students['Primary_Field'].fillna('').astype(str),
+        'Secondary_Field': students['Secondary_Field'].fillna('').astype(str),
+    })
+    student_z_scores = pd.to_numeric(students['Z_Score'], errors='coerce').to_numpy(dtype=float)
+
+    student_groups = group_keys.groupby(list(group_keys.columns), sort=False).indices
+    if profile is not None:
+        profile.lap('grouping', students=len(students), groups=len(student_groups))
+
+    # Per-group result arrays, turned into a single DataFrame at the end
+    result_students, result_ranks, result_rows, result_scores, result_margins = [], [], [], [], []
+
+    for (stream, district, primary_field, secondary_field), student_rows in student_groups.items():
+        candidates_df, table_rows = cutoff_index.lookup(stream, district)
+        if candidates_df is None:
+            continue
+
+        cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+        boost = cutoff_index.preference_boost(table_rows, primary_field, secondary_field)
+
+        for start in range(0, len(student_rows), BATCH_CHUNK_SIZE):
+            chunk_rows = student_rows[start:start + BATCH_CHUNK_SIZE]
+            scores, safety_margin = _score_matrix(student_z_scores[chunk_rows], cutoffs, boost)
+
+            # Ties break on table order, like the single-student path
+            top_courses = rank_top_k(scores, k, tiebreak=table_rows)
+            top_scores = np.take_along_axis(scores, top_courses, axis=1)
+
+            # Drop the slots that ran out of eligible courses
+            student_pos, rank = np.nonzero(np.isfinite(top_scores))
+            course_pos = top_courses[student_pos, rank]
+
+            result_students.append(chunk_rows[student_pos])
+            result_ranks.append(rank + 1)
+            result_rows.append(table_rows[course_pos])
+            result_scores.append(top_scores[student_pos, rank])
+            result_margins.append(safety_margin[student_pos, course_pos])
+
+    if profile is not None:
+        profile.lap('scoring', returned=sum(len(rows) for rows in result_students))
+    if not result_students:
+        _finish_profile(profile)
+        return pd.DataFrame(columns=result_columns)
+
+    result_students = np.concatenate(result_students)
+    result_ranks = np.concatenate(result_ranks)
+
+    # Back to roster order, best course first for every student
+    order = np.lexsort((result_ranks, result_students))
+
+    batch_df = cutoff_index.table.iloc[np.concatenate(result_rows)[order]][['Course', 'University', 'Z_Score', 'District']]
+    batch_df = batch_df.reset_index(drop=True)
+    batch_df.insert(0, 'Rank', result_ranks[order])
+    batch_df.insert(0, 'Student_ID', students.index[result_students[order]])
+    batch_df['Compatibility_Score'] = np.concatenate(result_scores)[order]
+    batch_df['Safety_Margin'] = np.concatenate(result_margins)[order].round(4)
+    batch_df = _with_plain_strings(batch_df[result_columns].reset_index(drop=True))
+    if profile is not None:
+        profile.lap('assemble')
+
+    _finish_profile(profile)
+    return batch_df
+
+class ZScoreSweep:
+    """
+    "What-if" engine: the recommendations of one student profile (district,
+    stream and preferences) over a range of Z-Scores.
+
+    For a fixed profile every course score is piecewise linear in the Z-Score:
+    the course becomes eligible at its cutoff, its margin score rises until
+    cutoff + MAX_ZSCORE_MARGIN_CAP and stays flat after that. The ranking can
+    only change at those points or where a rising course overtakes a flat one,
+    so these breakpoints are computed once per profile. recommend() scores a
+    whole vector of Z-Scores in one pass and intervals() returns the Z-Score
+    ranges over which the top-k list stays the same.
+    """
+
+    def __init__(self, district, primary_field, secondary_field, stream, df_cutoffs, cutoff_index=None, k=None,
+                 cutoff_estimate=None):
+        self.k = RECOMMENDATION_COUNT if k is None else k
+        self.candidates_df, self.table_rows = None, np.empty(0, dtype=np.intp)
+        self.cutoffs = self.boost = self.breakpoints = np.empty(0)
+
+        if df_cutoffs is None:
+            return
+        cutoff_index = _resolve_cutoff_index(df_cutoffs, cutoff_index, cutoff_estimate)
+
+        candidates_df, table_rows = _find_candidates(cutoff_index, stream, district)
+        if candidates_df is None:
+            return
+
+        self.candidates_df, self.table_rows = candidates_df, table_rows
+        self.cutoffs = cutoff_index.candidate_cutoffs(stream, district)
+        self.boost = cutoff_index.preference_boost(table_rows, primary_field, secondary_field)
+
+        # A course rising from cutoff c with boost b meets a flat course with boost b' at
+        # c + CAP * (1 + (WEIGHT_PREFERENCE / WEIGHT_MARGIN) * (b' - b)), if that lies on its
+        # rising part. b' == b is the end of the rise (cutoff + CAP).
+        boost_levels = np.unique(self.boost)
+        offsets = MAX_ZSCORE_MARGIN_CAP * (
+            1 + (WEIGHT_PREFERENCE / WEIGHT_MARGIN) * (boost_levels[None, :] - self.boost[:, None])
+        )
+        on_rise = (offsets >= 0) & (offsets <= MAX_ZSCORE_MARGIN_CAP)
+        crossings = (self.cutoffs[:, None] + offsets)[on_rise]
+        self.breakpoints = np.unique(np.concatenate([self.cutoffs, crossings]))
+
+    def _top_k(self, z_scores):
+        """
+        Ranks the candidates for every Z-Score. Returns the top-k candidate
+        positions, their scores (-inf in the slots without an eligible course)
+        and their safety margins, one row per Z-Score.
+        """
+        scores, safety_margin = _score_matrix(z_scores, self.cutoffs, self.boost)
+        top_courses = rank_top_k(scores, self.k, tiebreak=self.table_rows)
+        return (top_courses, np.take_along_axis(scores, top_courses, axis=1),
+                np.take_along_axis(safety_margin, top_courses, axis=1))
+
+    def _top_k_lists(self, z_scores):
+        """Returns the top-k candidate positions for every Z-Score, -1 in the slots without an eligible course."""
+        top_courses, top_scores, _ = self._top_k(z_scores)
+        top_courses[~np.isfinite(top_scores)] = -1
+        return top_courses
+
+    def recommend(self, z_scores):
+        """
+        Returns the top-k recommendations for every Z-Score in z_scores as a
+        long-format DataFrame (Student_Z_Score, Rank, RECOMMENDATION_COLUMNS),
+        identical to calling calculate_compatibility_score once per Z-Score.
+        """
+        z_scores = np.atleast_1d(np.asarray(z_scores, dtype=float))
+        result_columns = ['Student_Z_Score', 'Rank'] + RECOMMENDATION_COLUMNS
+        if self.candidates_df is None:
+            return pd.DataFrame(columns=result_columns)
+
+        result_points, result_ranks, result_courses, result_scores, result_margins = [], [], [], [], []
+        for start in range(0, len(z_scores), BATCH_CHUNK_SIZE):
+            top_courses, top_scores, top_margins = self._top_k(z_scores[start:start + BATCH_CHUNK_SIZE])
+
+            # Drop the slots that ran out of eligible courses
+            point, rank = np.nonzero(np.isfinite(top_scores))
+            result_points.append(start + point)
+            result_ranks.append(rank + 1)
+            result_courses.append(top_courses[point, rank])
+            result_scores.append(top_scores[point, rank])
+            result_margins.append(top_margins[point, rank])
+
+        if not result_points:
+            return pd.DataFrame(columns=result_columns)
+
+        sweep_df = self.candidates_df.iloc[np.concatenate(result_courses)][['Course', 'University', 'Z_Score', 'District']]
+        sweep_df = sweep_df.reset_index(drop=True)
+        sweep_df.insert(0, 'Rank', np.concatenate(result_ranks))
+        sweep_df.insert(0, 'Student_Z_Score', z_scores[np.concatenate(result_points)])
+        sweep_df['Compatibility_Score'] = np.concatenate(result_scores)
+        sweep_df['Safety_Margin'] = np.concatenate(result_margins).round(4)
+
+        return _with_plain_strings(sweep_df[result_columns])
+
+    def intervals(self, z_min, z_max):
+        """
+        Splits [z_min, z_max] into the Z-Score ranges with the same top-k list.
+
+        Returns a long-format DataFrame (Z_From, Z_To, Rank, Course, University,
+        Z_Score, District): one block per range, which covers Z_From <= z <= Z_To.
+        The list is evaluated at and around every breakpoint and between
+        neighbouring breakpoints; where rounding moves a change off its
+        breakpoint, the samples around it are bisected down to neighbouring
+        floats, so the ranges are exact. Ranges without an eligible course have no rows.
+        """
+        result_columns = ['Z_From', 'Z_To', 'Rank', 'Course', 'University', 'Z_Score', 'District']
+        if z_min > z_max:
+            raise ValueError("z_min must not be greater than z_max.")
+        if self.candidates_df is None:
+            return pd.DataFrame(columns=result_columns)
+
+        inner = self.breakpoints[(self.breakpoints > z_min) & (self.breakpoints < z_max)]
+        points = np.unique(np.concatenate([[z_min], inner, [z_max]]))
+        # Each breakpoint with its neighbouring floats, where the list usually changes, and the middle of each gap
+        samples = np.concatenate([
+            points, np.nextafter(inner, -np.inf), np.nextafter(inner, np.inf), (points[:-1] + points[1:]) / 2
+        ])
+        samples = np.unique(samples[(samples >= z_min) & (samples <= z_max)])
+        top_courses = self._top_k_lists(samples)
+
+        # Bisect every pair of neighbouring samples with different lists until they are neighbouring floats
+        while True:
+            changed = (top_courses[1:] != top_courses[:-1]).any(axis=1)
+            gaps = np.flatnonzero(changed & (np.nextafter(samples[:-1], np.inf) < samples[1:]))
+            if not len(gaps):
+                break
+            middles = samples[gaps] + (samples[gaps + 1] - samples[gaps]) / 2
+            middles = np.clip(middles, np.nextafter(samples[gaps], np.inf), np.nextafter(samples[gaps + 1], -np.inf))
+            samples = np.insert(samples, gaps + 1, middles)
+            top_courses = np.insert(top_courses, gaps + 1, self._top_k_lists(middles), axis=0)
+
+        # Neighbouring samples with the same list form one range
+        starts = np.concatenate([[0], np.flatnonzero((top_courses[1:] != top_courses[:-1]).any(axis=1)) + 1])
+        ends = np.append(starts[1:], len(samples)) - 1
+
+        piece, rank = np.nonzero(top_courses[starts] >= 0)
+        intervals_df = self.candidates_df.iloc[top_courses[starts][piece, rank]][['Course', 'University', 'Z_Score', 'District']]
+        intervals_df = intervals_df.reset_index(drop=True)
+        intervals_df.insert(0, 'Rank', rank + 1)
+        intervals_df.insert(0, 'Z_To', samples[ends][piece])
+        intervals_df.insert(0, 'Z_From', samples[starts][piece])
+
+        return _with_plain_strings(intervals_df[result_columns])
 
-    merged_df = district_cutoff_df.copy()
-    
-    # 3. Z-Score Eligibility and Margin Calculation (Uses the 'Z_Score' which is now the Average)
-    
-    # Check if the student's Z-Score meets or exceeds the course cutoff
-    merged_df['Is_Eligible'] = merged_df['Z_Score'] <= student_z_score
-    
-    # Calculate the Safety Margin 
-    merged_df['Safety_Margin'] = student_z_score - merged_df['Z_Score']
-    
-    # Apply the CAP for the Margin Score calculation (only positive margins are used)
-    merged_df['Capped_Margin'] = np.clip(merged_df['Safety_Margin'], 0, MAX_ZSCORE_MARGIN_CAP)
-    
-    # Normalize the Capped Margin (Scaled to 0 to 1)
-    merged_df['Margin_Score'] = merged_df['Capped_Margin'] / MAX_ZSCORE_MARGIN_CAP
-    
-    # --- WEIGHTED SCORING ---
-    
-    # 4. Preference Boost Calculation
-    merged_df['Preference_Boost'] = BASE_BOOST_VALUE # Give a base boost to all stream-eligible courses
-    
-    # Primary Field Match 
-    if primary_field:
-        primary_mask = merged_df['Course'].str.contains(primary_field, case=False, na=False)
-        merged_df.loc[primary_mask, 'Preference_Boost'] = PRIMARY_BOOST_VALUE
-
-    # Secondary Field Match 
-    if secondary_field and secondary_field.lower() != primary_field.lower():
-        secondary_mask = merged_df['Course'].str.contains(secondary_field, case=False, na=False)
-        # Apply secondary boost only if it didn't get the primary boost
-        merged_df.loc[~primary_mask & secondary_mask, 'Preference_Boost'] = SECONDARY_BOOST_VALUE
-        
-    # 5. Final Weighted Score Calculation
-    # The final score is a weighted average of normalized margin and preference boost.
-    merged_df['Compatibility_Score'] = (merged_df['Margin_Score'] * WEIGHT_MARGIN) + \
-                                       (merged_df['Preference_Boost'] * WEIGHT_PREFERENCE)
-
-    # 6. Final Filtering and Ranking
-    
-    # Filter only for eligible courses (where Z-Score meets or exceeds cutoff)
-    recommended_df = merged_df[merged_df['Is_Eligible'] == True].copy()
-    recommended_df = recommended_df.sort_values(by='Compatibility_Score', ascending=False)
-    final_recommendations = recommended_df.head(RECOMMENDATION_COUNT)
-    
-    # Ensure Safety Margin displays the true margin (not the capped value)
-    final_recommendations['Safety_Margin'] = final_recommendations['Safety_Margin'].round(4)
-    
-    output_columns = ['Course', 'University', 'Z_Score', 'District', 'Compatibility_Score', 'Safety_Margin']
-    
-    return final_recommendations[output_columns]
 
 def run_recommendation_demo():
     """Runs a demonstration of the recommendation system."""
@@ -212,5 +2106,37 @@ def run_recommendation_demo():
         recommendations['Compatibility_Score'] = recommendations['Compatibility_Score'].round(3)
         print(recommendations.reset_index(drop=True))
 
+def run_batch_recommendations(roster_path, output_path, k=RECOMMENDATION_COUNT):
+    """Scores a roster CSV and writes the long-format results to a CSV file."""
+    students = _read_roster(roster_path)
+    if students is None:
+        return
+
+    df_cutoffs = load_data(ZSCORE_DATA_FILES)
+    if df_cutoffs is None:
+        return
+
+    batch_df = recommend_batch(students, df_cutoffs, k=k)
+    batch_df.to_csv(output_path, index=False)
+    print(f"Wrote {len(batch_df)} recommendations for {batch_df['Student_ID'].nunique()} students to '{output_path}'.")
+
+
 if __name__ == "__main__":
-    run_recommendation_demo()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="University course recommendation system.")
+    parser.add_argument('--roster', help="Roster CSV with one student per row (runs the demo if omitted).")
+    parser.add_argument('--output', default='recommendations.csv', help="Results CSV for --roster.")
+    parser.add_argument('--top-k', type=int, default=RECOMMENDATION_COUNT, help="Recommendations per student.")
+    parser.add_argument('--publish-shared', metavar='DIR',
+                        help="Load the data and publish it to DIR for the web app workers to share.")
+    args = parser.parse_args()
+
+    if args.publish_shared:
+        df_cutoffs = load_data(ZSCORE_DATA_FILES)
+        if df_cutoffs is not None:
+            os.makedirs(args.publish_shared, exist_ok=True)
+            version = publish_shared_table(df_cutoffs, args.publish_shared)
+            print(f"Published {len(df_cutoffs)} cutoff entries to '{args.publish_shared}' as {version}.")
+    elif args.roster:
+        run_batch_recommendations(args.roster, args.output, k=args.top_k)
+    else:
+        run_recommendation_demo()
\ No newline at end of file
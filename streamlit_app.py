@@ -1,11 +1,14 @@
+import contextlib
+import os
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 st.set_page_config(layout="wide")
 
 # Importing your recommendation_system file and the file list
 # We import ZSCORE_DATA_FILES to pass the list of 3-year files to load_data
-from recommendation_system import load_data, calculate_compatibility_score, ZSCORE_DATA_FILES
+from recommendation_system import load_data, CutoffTableStore, ZSCORE_DATA_FILES, \
+    PREFERENCE_FIELD_OPTIONS, SharedCutoffTable, publish_shared_table, RecommendationCache, ZScoreSweep, \
+    profile_stages, get_process_profiler, admission_chances, calculate_multi_preference_score, RESULT_CACHE_SIZE
 
 # --- 1. CONFIGURATION ---
 # District Options
@@ -15,21 +18,83 @@ DISTRICT_OPTIONS = [
     'VAVUNIYA', 'TRINCOMALEE', 'BATTICALOA', 'AMPARA', 'PUTTALAM', 'KURUNAGALA', 
     'ANURADHAPURA', 'POLONNARUWA', 'BADULLA', 'MONARAGALA', 'KEGALLE', 'RATHNAPURA'
 ]
-PRIMARY_FIELD_OPTIONS = ['MEDICINE', 'DENTAL SURGERY', 'VETERINARY SCIENCE', 'BIOCHEMISTRY & MOLECULAR BIOLOGY', 'AGRICULTURAL TECHNOLOGY & MANAGEMENT', 'AGRICULTURE', 'FOOD SCIENCE & NUTRITION', 'FOOD SCIENCE & TECHNOLOGY', 'BIOLOGICAL SCIENCE', 'APPLIED SCIENCES (BIO.SC)', 'ENGINEERING', 'ENGINEERING (EM)', 'ENGINEERING (TM)', 'QUANTITY SURVEYING', 'COMPUTER SCIENCE', 'PHYSICAL SCIENCE', 'SURVEYING SCIENCE', 'APPLIED SCIENCES (PHY.SC)', 'MANAGEMENT', 'REAL ESTATE MANAGEMENT & VALUATION', 'COMMERCE', 'MANAGEMENT AND PUBLIC POLICY', 'BUSINESS INFORMATION SYSTEMS', 'FINANCIAL ENGINEERING', 'BANKING & INSURANCE', 'SERVICE MANAGEMENT', 'LAW', 'ARTS *', 'ARTS (SP) / MASS MEDIA* #', 'ARTS (SP) / PERFORMING ARTS * #','ACCOUNTING INFORMATION SYSTEMS', 'AGRICULTURAL RESOURCE MANAGEMENT AND', 'AGRICULTURAL TECHNOLOGY & MANAGEMENT', 'AGRICULTURE', 'AGRI BUSINESS MANAGEMENT', 'ANIMAL PRODUCTION AND FOOD TECHNOLOGY', 'ANIMAL SCIENCE & FISHERIES', 'APPLIED CHEMISTRY', 'APPLIED SCIENCES (BIO.SC)', 'APPLIED SCIENCES (PHY.SC)', 'AQUATIC BIORESOURCES', 'ARABIC LANGUAGE *', 'ARCHITECTURE #', 'ARTS *', 'ARTS (SAB) - A * [ARTS STREAM]', 'ARTS (SAB) - B * [COMMERCE STREAM]', 'ARTS (SP) / MASS MEDIA* #', 'ARTS (SP) / PERFORMING ARTS * #', 'ARTS-INFORMATION TECHNOLOGY *', 'ARTIFICIAL INTELLIGENCE', 'AYURVEDA MEDICINE & SURGERY', 'BANKING & INSURANCE', 'BIOCHEMISTRY & MOLECULAR BIOLOGY', 'BIOLOGICAL SCIENCE', 'BIOMEDICAL TECHNOLOGY', 'BUSINESS INFORMATION SYSTEMS', 'BUSINESS SCIENCE', 'COMMERCE', 'COMMUNICATION STUDIES *', 'COMPUTER SCIENCE', 'COMPUTER SCIENCE & TECHNOLOGY', 'CREATIVE MUSIC TECHNOLOGY & PRODUCTION', 'DATA SCIENCE', 'DENTAL SURGERY', 'DESIGN #', 'ELECTRONICS AND COMPUTER SCIENCE', 'ENGINEERING', 'ENGINEERING (EM)', 'ENGINEERING (TM)', 'ENTREPRENEURSHIP AND MANAGEMENT', 'ENVIRONMENTAL CONSERVATION &', 'EXPORT AGRICULTURE', 'FACILITIES MANAGEMENT', 'FASHION DESIGN & PRODUCT DEVELOPMENT #', 'FINANCIAL ECONOMICS', 'FINANCIAL ENGINEERING', 'FINANCIAL MATHEMATICS AND INDUSTRIAL STATISTICS', 'FISHERIES & MARINE SCIENCES', 'FOOD BUSINESS MANAGEMENT', 'FOOD PRODUCTION', 'FOOD SCIENCE & NUTRITION', 'FOOD SCIENCE & TECHNOLOGY', 'GEOGRAPHICAL INFORMATION SCIENCE', 'GREEN TECHNOLOGY', 'HEALTH INFORMATION AND COMMUNICATION', 'HEALTH PROMOTION', 'HEALTH TOURISM AND HOSPITALITY MANAGEMENT', 'HUMAN RESOURCE DEVELOPMENT', 'INDIGENOUS MEDICINAL RESOURCES', 'INDIGENOUS PHARMACEUTICAL TECHNOLOGY', 'INDUSTRIAL INFORMATION', 'INDUSTRIAL STATISTICS &', 'INFORMATION AND COMMUNICATION TECHNOLOGY', 'INFORMATION SYSTEMS', 'INFORMATION TECHNOLOGY (IT)', 'INFORMATION TECHNOLOGY & MANAGEMENT', 'ISLAMIC STUDIES *', 'LANDSCAPE ARCHITECTURE #', 'LAW', 'MANAGEMENT', 'MANAGEMENT AND INFORMATION', 'MANAGEMENT AND PUBLIC POLICY', 'MANAGEMENT STUDIES (TV) - A', 'MANAGEMENT STUDIES (TV) - B', 'MARINE AND FRESHWATER SCIENCES', 'MEDICAL IMAGING TECHNOLOGY', 'MEDICAL LABORATORY SCIENCES', 'MEDICINE', 'MINERAL RESOURCES AND', 'NURSING', 'OCCUPATIONAL THERAPY', 'OPTOMETRY', 'PEACE & CONFLICT RESOLUTION *', 'PHARMACY', 'PHYSICAL EDUCATION #', 'PHYSICAL SCIENCE', 'PHYSIOTHERAPY', 'PRIMARY EDUCATION', 'QUANTITY SURVEYING', 'RADIOGRAPHY', 'REAL ESTATE MANAGEMENT & VALUATION', 'SCIENCE AND TECHNOLOGY', 'SERVICE MANAGEMENT', 'SIDDHA MEDICINE & SURGERY', 'SOCIAL STUDIES IN INDIGENOUS KNOWLEDGE', 'SOCIAL WORK *', 'SOFTWARE ENGINEERING', 'SPEECH AND HEARING SCIENCES', 'SPORTS SCIENCE & MANAGEMENT #', 'STATISTICS & OPERATIONS RESEARCH', 'SURVEYING SCIENCE', 'TOURISM & HOSPITALITY MANAGEMENT', 'UNANI MEDICINE & SURGERY', 'URBAN BIORESOURCES', 'URBAN INFORMATICS AND PLANNING', 'VETERINARY SCIENCE', 'YOGA AND PARAPSYCHOLOGY','AQUATIC RESOURCES TECHNOLOGY', 'HOSPITALITY, TOURISM', 'ENGLISH LANGUAGE & APPLIED LINGUISTICS', 'PLANTATION MANAGEMENT AND TECHNOLOGY', 'POLYMER SCIENCE AND INDUSTRIAL MANAGEMENT', 'ENGINEERING TECHNOLOGY (ET)', 'BIOSYSTEMS TECHNOLOGY (BST)', 'INFORMATION COMMUNICATION TECHNOLOGY', 'PHYSICAL SCIENCE -ICT', 'TRANSLATION STUDIES', 'FILM & TELEVISION STUDIES #', 'PROJECT MANAGEMENT', 'TEACHING ENGLISH AS A SECOND', 'VISUAL ARTS', 'MUSIC #', 'DANCE', 'DRAMA & THEATRE #', 'ART & DESIGN', 'VISUAL & TECHNOLOGICAL ARTS']
+PRIMARY_FIELD_OPTIONS = PREFERENCE_FIELD_OPTIONS  # Shared with the preference matcher
 STREAM_OPTIONS = ['Science', 'Technology', 'Arts', 'Commerce', 'Mathamatics']
+# Cutoff estimates (see CUTOFF_ESTIMATES in recommendation_system.py) offered to the student
+CUTOFF_ESTIMATE_LABELS = {
+    'mean': '3-year average',
+    'weighted': 'Recent years weighted more',
+    'projected': 'Trend projected to next year',
+    'max': 'Highest year (cautious)',
+    'min': 'Lowest year (optimistic)',
+}
+# Admission chance labels: (lowest probability, emoji, label, colour), checked in order
+ADMISSION_CHANCE_LEVELS = [
+    (0.95, "🟢", "Very High Chance", "#28a745"),  # Green
+    (0.80, "🟡", "Good Chance", "#ffc107"),  # Yellow
+    (0.60, "🟠", "Moderate Chance", "#fd7e14"),  # Orange
+    (0.00, "⚠️", "Close to Cutoff", "#17a2b8"),  # Info/Blue
+]
+WHAT_IF_RANGE = 0.5  # The what-if slider covers the student's Z-Score +/- this much
+
+# Optional: directory of a cutoff table shared by all server processes on this host
+# (publish or reload it with `python recommendation_system.py --publish-shared DIR`)
+SHARED_TABLE_DIR = os.environ.get('ZSCORE_SHARED_TABLE_DIR')
 # --- END CONFIGURATION ---
 
 # 2. Initial data loading (only once when the web app starts)
-@st.cache_data
-def get_data():
+# The table and its (stream, district) index are kept as one shared resource per server
+# process. Every rerun syncs it with ZSCORE_DATA_FILES: a new or removed year file (or an
+# edited one) is folded in incrementally and swapped in atomically, without a restart.
+# (An edited ZSCORE_DATA_FILES list is seen once Streamlit's file watcher reloads the module.)
+@st.cache_resource
+def get_table_store():
     """Load and average Z-Score data from multiple files."""
     st.info(f"Loading and averaging Z-Scores from {len(ZSCORE_DATA_FILES)} files...")
-    df = load_data(ZSCORE_DATA_FILES)
-    if df is None or df.empty:
-        st.error("🚨 Data loading failed. Please check if the CSV files are present in the directory.")
-    return df
+    return CutoffTableStore(ZSCORE_DATA_FILES)
+
+# Shared mode: the table is memory-mapped from SHARED_TABLE_DIR (zero-copy, read-only)
+# and every process switches to a newly published version on its next rerun
+@st.cache_resource
+def get_shared_table():
+    """Attach to the shared cutoff table, publishing it first if no process has yet."""
+    shared_table = SharedCutoffTable(SHARED_TABLE_DIR)
+    if shared_table.current()[0] is None:
+        df = load_data(ZSCORE_DATA_FILES)
+        if df is not None:
+            os.makedirs(SHARED_TABLE_DIR, exist_ok=True)
+            # Replicas starting together publish once; the others attach to that version
+            publish_shared_table(df, SHARED_TABLE_DIR, if_unpublished=True)
+    return shared_table
 
-df_cutoffs = get_data()
+# Results per (district, stream, preferences), shared by every session of this process.
+# Each entry holds the candidate courses sorted by cutoff, so any Z-Score is a quick lookup.
+@st.cache_resource
+def get_result_cache():
+    """Create the process-wide recommendation result cache."""
+    return RecommendationCache(candidate_lists=True)
+
+# Breakpoints of one student profile, so moving the what-if slider never re-runs the pipeline.
+# index_version keys the entry to the loaded cutoff table (underscored arguments are not hashed).
+# Bounded like the result cache: each entry also keeps its version of the table alive.
+@st.cache_resource(max_entries=RESULT_CACHE_SIZE)
+def get_zscore_sweep(district, primary_field, secondary_field, stream, cutoff_estimate, index_version,
+                     _df_cutoffs, _cutoff_index):
+    """Precompute the Z-Score sweep of one (district, stream, preferences) profile."""
+    return ZScoreSweep(district, primary_field, secondary_field, stream, _df_cutoffs, cutoff_index=_cutoff_index,
+                       cutoff_estimate=cutoff_estimate)
+
+if SHARED_TABLE_DIR:
+    df_cutoffs, cutoff_index = get_shared_table().current()
+    if df_cutoffs is None:
+        st.error("🚨 Data loading failed. Please check if the CSV files are present in the directory.")
+else:
+    table_store = get_table_store()
+    # Never waits: while another session rebuilds the table, this one keeps the current pair
+    table_store.sync(ZSCORE_DATA_FILES, blocking=False)
+    df_cutoffs, cutoff_index = table_store.current()
+    if df_cutoffs is None or df_cutoffs.empty:
+        st.error("🚨 Data loading failed. Please check if the CSV files are present in the directory.")
 
 # --- Custom CSS for Styling ---
 def apply_custom_css():
@@ -140,6 +205,9 @@ st.write("Select the most suitable university courses based on your Z-Score and
 if df_cutoffs is None or df_cutoffs.empty:
     st.stop()
 
+# Debug: per-stage timings of the recommendation call (on by default when ZSCORE_PROFILE is set)
+show_stage_timings = st.sidebar.checkbox("🐞 Show stage timings", value=get_process_profiler() is not None)
+
 # --- UI Input Section ---
 st.subheader("⚙️ Input Data (Your Inputs)")
 with st.form("student_inputs", clear_on_submit=False):
@@ -169,6 +237,17 @@ with st.form("student_inputs", clear_on_submit=False):
             secondary_field_default_index = 0
             
         secondary_field = st.selectbox("5. Secondary Preference (Field):", PRIMARY_FIELD_OPTIONS, index=secondary_field_default_index)
+
+    # Optional: further ranked preferences and districts, answered in one multi-preference query
+    col_f, col_g = st.columns(2)
+    with col_f:
+        further_fields = st.multiselect("Further Preferences (optional, in order):", list(dict.fromkeys(PRIMARY_FIELD_OPTIONS)))
+    with col_g:
+        # Spelled as in the data, so every district picked here has cutoffs
+        further_districts = st.multiselect("Also Consider Districts (optional):", cutoff_index.district_names)
+
+    cutoff_estimate = st.selectbox("6. Compare With (Cutoff Estimate):", list(CUTOFF_ESTIMATE_LABELS),
+                                   format_func=CUTOFF_ESTIMATE_LABELS.get)
     
     st.markdown("---")
     submitted = st.form_submit_button("✅ Get Recommendations", type="primary", use_container_width=True)
@@ -176,17 +255,56 @@ with st.form("student_inputs", clear_on_submit=False):
 # --- Main Content Area for Results ---
 
 if submitted and df_cutoffs is not None:
+    districts = list(dict.fromkeys([district] + further_districts))
+    # Remembered for the what-if section, which must survive the slider's reruns
+    st.session_state['last_inputs'] = {
+        'z_score': z_score, 'district': district, 'primary_field': primary_field,
+        'secondary_field': secondary_field, 'stream': stream, 'cutoff_estimate': cutoff_estimate,
+        'districts': districts, 'further_fields': further_fields,
+    }
+
     st.subheader("📊 Analysis Results")
     
     # 2. Running the algorithm
-    recommendations_df = calculate_compatibility_score(
-        student_z_score=z_score,
-        district=district,
-        primary_field=primary_field,
-        secondary_field=secondary_field,
-        stream=stream,
-        df_cutoffs=df_cutoffs
-    )
+    with profile_stages() if show_stage_timings else contextlib.nullcontext() as profiler:
+        if further_fields or len(districts) > 1:
+            recommendations_df = calculate_multi_preference_score(
+                student_z_score=z_score,
+                districts=districts,
+                preference_fields=[primary_field, secondary_field] + further_fields,
+                stream=stream,
+                df_cutoffs=df_cutoffs,
+                cutoff_index=cutoff_index,
+                cutoff_estimate=cutoff_estimate
+            )
+        else:
+            recommendations_df = get_result_cache().recommend(
+                student_z_score=z_score,
+                district=district,
+                primary_field=primary_field,
+                secondary_field=secondary_field,
+                stream=stream,
+                df_cutoffs=df_cutoffs,
+                cutoff_index=cutoff_index,
+                cutoff_estimate=cutoff_estimate
+            )
+
+        # Admission probability of every course in reach, including those just above the Z-Score
+        chances_df = pd.concat([
+            admission_chances(z_score, chance_district, stream, df_cutoffs, cutoff_index=cutoff_index,
+                              cutoff_estimate=cutoff_estimate)
+            for chance_district in districts
+        ])
+
+    if profiler is not None:
+        with st.expander("🐞 Debug: Stage Timings"):
+            for record in profiler.records:
+                st.markdown(f"**{record['name']}** — {record['total_ms']:.3f} ms")
+                st.dataframe(
+                    pd.DataFrame({'Stage': list(record['stages_ms']), 'Time (ms)': list(record['stages_ms'].values())}),
+                    use_container_width=True, hide_index=True
+                )
+                st.json(record['counts'])
     
     st.markdown("---")
 
@@ -194,29 +312,24 @@ if submitted and df_cutoffs is not None:
         st.error("😔 **Sorry:** No suitable courses were found based on your inputs. Please check your Stream, Z-Score, or District values.")
     else:
         # --- Z-SCORE ANALYSIS & SAFETY MARGIN FOR TOP COURSE ---
+
+        # Every recommended course is eligible, so it is in chances_df (probability >= 0.5)
+        recommendations_df = recommendations_df.merge(
+            chances_df[['Course', 'University', 'District', 'Admission_Probability']],
+            on=['Course', 'University', 'District'], how='left'
+        )
         
         top_recommendation = recommendations_df.iloc[0]
         top_course = top_recommendation['Course']
         required_cutoff = top_recommendation['Z_Score']
         safety_margin = top_recommendation['Safety_Margin']
+        admission_probability = top_recommendation['Admission_Probability']
         
-        # Determine Safety Status and Message
-        if safety_margin >= 0.15:
-            status_emoji = "🟢"
-            margin_status = "Very High Chance (Very Safe Margin)"
-            status_color = "#28a745" # Green
-        elif safety_margin >= 0.05:
-            status_emoji = "🟡"
-            margin_status = "Good Chance (Safe Margin)"
-            status_color = "#ffc107" # Yellow
-        elif safety_margin > 0.0:
-            status_emoji = "🟠"
-            margin_status = "Moderate Chance (Moderate Margin)"
-            status_color = "#fd7e14" # Orange
-        else:
-            status_emoji = "⚠️"
-            margin_status = "Close to Cutoff (Zero or Low Margin)"
-            status_color = "#17a2b8" # Info/Blue 
+        # Determine Safety Status and Message from the estimated admission chance
+        for min_probability, status_emoji, margin_status, status_color in ADMISSION_CHANCE_LEVELS:
+            if admission_probability >= min_probability:
+                break
+        margin_status = f"{margin_status} (≈{admission_probability:.0%} estimated admission chance)"
 
         st.markdown(f'<div class="analysis-box">', unsafe_allow_html=True)
         st.markdown("#### 📈 Z-Score Analysis (Top Recommendation)")
@@ -270,6 +383,10 @@ if submitted and df_cutoffs is not None:
         final_plot_df = pd.concat([plot_data, student_z_score_df])
 
         # 4.2. Create the Plotly Bar Chart
+        # Plotly is imported here, when there is a chart to draw, so starting the app and
+        # showing the form never pays its (large) import time
+        import plotly.express as px
+
         fig = px.bar(
             final_plot_df, 
             x='Z_Score_Value', 
@@ -314,16 +431,89 @@ if submitted and df_cutoffs is not None:
                 'Z_Score': 'Avg. Cutoff Z-Score',
                 'District': 'District',
                 'Compatibility_Score': 'Compatibility Score',
-                'Safety_Margin': 'Safety Margin'
+                'Safety_Margin': 'Safety Margin',
+                'Admission_Probability': 'Admission Chance'
             }).drop(columns=['Course_Uni']).reset_index(drop=True), 
             use_container_width=True
         )
 
         st.info("ℹ️ Compatibility Score: This is the final score calculated based on your Z-Score margin and your selected Preference Fields. A higher score indicates a better fit.")
 
+        # Near misses: courses above your Z-Score that may still drop below it next year
+        near_miss_df = chances_df[chances_df['Z_Score'] > z_score]
+        if not near_miss_df.empty:
+            st.subheader("🎯 Within Reach (Cutoff Just Above Your Z-Score)")
+            st.dataframe(
+                near_miss_df.rename(columns={
+                    'Z_Score': 'Avg. Cutoff Z-Score',
+                    'Admission_Probability': 'Admission Chance',
+                    'Safety_Margin': 'Safety Margin'
+                }).reset_index(drop=True),
+                use_container_width=True
+            )
+
 
         st.warning("""
         ⚠️ Please Note:The results provided are calculated based on the average Z-scores of the past three years. 
         These suggestions are intended solely to assist your decision-making process. 
         However, once the official Z-scores for your year are released, you can check them here to obtain a more accurate result.
-        """)
\ No newline at end of file
+        """)
+
+# --- What-if Section: how the list changes with the Z-Score ---
+if 'last_inputs' in st.session_state and cutoff_index is not None:
+    inputs = st.session_state['last_inputs']
+    # Further preferences or districts: the what-if list re-runs the same multi-preference query
+    multi_preference = bool(inputs.get('further_fields')) or len(inputs.get('districts', [])) > 1
+
+    st.markdown("---")
+    st.subheader("🔮 What-if: A Different Z-Score")
+
+    z_min = max(0.0, inputs['z_score'] - WHAT_IF_RANGE)
+    z_max = min(4.0, inputs['z_score'] + WHAT_IF_RANGE)
+    what_if_z_score = st.slider("What if my Z-Score were:", min_value=z_min, max_value=z_max,
+                                value=inputs['z_score'], step=0.0001, format="%.4f")
+
+    if multi_preference:
+        what_if_df = calculate_multi_preference_score(
+            student_z_score=what_if_z_score,
+            districts=inputs['districts'],
+            preference_fields=[inputs['primary_field'], inputs['secondary_field']] + inputs['further_fields'],
+            stream=inputs['stream'],
+            df_cutoffs=df_cutoffs,
+            cutoff_index=cutoff_index,
+            cutoff_estimate=inputs['cutoff_estimate']
+        )
+    else:
+        sweep = get_zscore_sweep(
+            inputs['district'], inputs['primary_field'], inputs['secondary_field'], inputs['stream'],
+            inputs['cutoff_estimate'], cutoff_index.version, df_cutoffs, cutoff_index
+        )
+        what_if_df = sweep.recommend([what_if_z_score]).drop(columns=['Student_Z_Score'])
+
+    if what_if_df.empty:
+        st.error("😔 No eligible courses at this Z-Score.")
+    else:
+        st.dataframe(
+            what_if_df.rename(columns={
+                'Z_Score': 'Avg. Cutoff Z-Score',
+                'Compatibility_Score': 'Compatibility Score',
+                'Safety_Margin': 'Safety Margin'
+            }),
+            use_container_width=True, hide_index=True
+        )
+
+    # Z-Score ranges where the recommended list changes (swept for one district and two preferences)
+    if multi_preference:
+        st.caption("📐 Z-Score ranges with a different list are only shown for one district and two preferences.")
+    else:
+        intervals_df = sweep.intervals(z_min, z_max)
+        if not intervals_df.empty:
+            with st.expander(f"📐 Z-Score ranges with a different recommendation list ({z_min:.4f} - {z_max:.4f})"):
+                range_summary = intervals_df.groupby(['Z_From', 'Z_To'], sort=False).agg(
+                    Courses=('Course', 'count'), Top_Course=('Course', 'first')
+                ).reset_index()
+                st.dataframe(
+                    range_summary.rename(columns={'Z_From': 'From Z-Score', 'Z_To': 'To Z-Score',
+                                                  'Top_Course': 'Top Recommendation'}),
+                    use_container_width=True, hide_index=True
+                )
@@ -0,0 +1,89 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from recommendation_system import load_data, ZSCORE_DATA_FILES
+
+# ----------------------------------------------------------------------
+# SYNTHETIC DATA SETTINGS
+# ----------------------------------------------------------------------
+SYNTHETIC_YEARS = 3  # Yearly files written per data set
+YEAR_NOISE = 0.08  # Std. deviation of a cutoff's change from one year to the next
+DROP_FRACTION = 0.05  # Share of (course, district) cutoffs missing from any one year
+SYNTHETIC_FILE_PATTERN = 'final_zscore_data_synthetic_{year:02d}.csv'
+
+# ----------------------------------------------------------------------
+
+
+def generate_synthetic_data(output_dir, scale=10, years=SYNTHETIC_YEARS, seed=0, source_files=ZSCORE_DATA_FILES):
+    """
+    Writes 'years' CSV files shaped like final_zscore_data_new_*.csv with
+    about 'scale' times as many rows as the real yearly files.
+
+    The real averaged table is the template: every (course, university) pair
+    is repeated 'scale' times, the copies being numbered variants of the real
+    course (same stream keywords) at numbered campuses of the real
+    universities, so course and university counts grow with the scale while
+    the 25 districts and each pair's district coverage stay realistic. The
+    cutoffs are the real ones plus a per-copy offset and per-year noise.
+    Returns the list of written file paths, or None if the template data
+    cannot be loaded.
+    """
+    template = load_data(source_files)
+    if template is None:
+        return None
+
+    rng = np.random.default_rng(seed)
+    pair_codes, pairs = pd.MultiIndex.from_arrays(
+        [template['Course'].astype(str), template['University'].astype(str)]
+    ).factorize()
+    pair_courses = pairs.get_level_values(0).to_numpy(dtype=object)
+    pair_universities = pairs.get_level_values(1).to_numpy(dtype=object)
+
+    # Copy 0 keeps the real names, copy n > 0 becomes "<COURSE> - TRACK n" at "<University> (Campus n)"
+    copies = np.repeat(np.arange(scale), len(template))
+    rows = np.tile(np.arange(len(template)), scale)
+    course_names = np.array([f' - TRACK {n}' if n else '' for n in range(scale)], dtype=object)
+    campus_names = np.array([f' (Campus {n})' if n else '' for n in range(scale)], dtype=object)
+
+    row_pairs = pair_codes[rows]
+    courses = pair_courses[row_pairs] + course_names[copies]
+    universities = pair_universities[row_pairs] + campus_names[copies]
+    districts = template['District'].astype(str).to_numpy(dtype=object)[rows]
+
+    # Copies of the same pair differ by one offset, so their cutoffs stay ordered across districts
+    pair_offsets = rng.normal(0, 0.15, size=(scale, len(pairs)))
+    pair_offsets[0] = 0
+    base_z_scores = template['Z_Score'].to_numpy()[rows] + pair_offsets[copies, row_pairs]
+
+    os.makedirs(output_dir, exist_ok=True)
+    file_paths = []
+    for year in range(1, years + 1):
+        kept = rng.random(len(rows)) >= DROP_FRACTION
+        year_df = pd.DataFrame({
+            'Course': courses[kept],
+            'University': universities[kept],
+            'District': districts[kept],
+            'Z_Score': (base_z_scores[kept] + rng.normal(0, YEAR_NOISE, size=kept.sum())).round(4),
+        })
+        file_path = os.path.join(output_dir, SYNTHETIC_FILE_PATTERN.format(year=year))
+        year_df.to_csv(file_path, index=False)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes synthetic Z-Score data files for benchmarking.")
+    parser.add_argument('output_dir', help="Directory for the generated CSV files.")
+    parser.add_argument('--scale', type=int, default=10, help="Size relative to the real data (e.g. 10, 100, 1000).")
+    parser.add_argument('--years', type=int, default=SYNTHETIC_YEARS, help="Yearly files to write.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    file_paths = generate_synthetic_data(args.output_dir, args.scale, args.years, args.seed)
+    if file_paths is not None:
+        for file_path in file_paths:
+            print(f"Wrote '{file_path}' ({os.path.getsize(file_path) / 1e6:.1f} MB)")
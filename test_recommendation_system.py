@@ -0,0 +1,379 @@
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import recommendation_system as rs
+
+# The real data files, next to this file (the tests may run from any directory)
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+REAL_FILES = [os.path.join(DATA_DIR, file_name) for file_name in rs.ZSCORE_DATA_FILES]
+
+
+def reference_load(file_paths):
+    """
+    The original load_data: every file concatenated in memory, the mean
+    Z_Score per key, one row per key in first-seen order (index = first row).
+    Course, University and District as load_data returns them.
+    """
+    combined_df = pd.concat([pd.read_csv(file_path) for file_path in file_paths], ignore_index=True)
+    combined_df = combined_df[rs.REQUIRED_COLUMNS].copy()
+    combined_df['Avg_Z_Score'] = combined_df.groupby(rs.GROUP_KEYS)['Z_Score'].transform('mean')
+    final_avg_df = combined_df.drop_duplicates(subset=rs.GROUP_KEYS, keep='first').copy()
+    final_avg_df = final_avg_df.drop(columns=['Z_Score']).rename(columns={'Avg_Z_Score': 'Z_Score'})
+    final_avg_df['District'] = final_avg_df['District'].str.upper()
+    return final_avg_df[rs.REQUIRED_COLUMNS].astype({col: 'category' for col in rs.GROUP_KEYS})
+
+
+def averaged(df_cutoffs):
+    """The key columns and the mean Z_Score of a loaded table."""
+    return df_cutoffs[rs.REQUIRED_COLUMNS]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keeps the on-disk table cache of every test in its own directory."""
+    monkeypatch.setattr(rs, 'CUTOFF_CACHE_DIR', str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def synthetic_files(tmp_path):
+    """
+    Four small year files with keys repeated inside a file, missing Z-Scores,
+    a missing course name and mixed-case districts.
+    """
+    rng = np.random.default_rng(0)
+    file_paths = []
+    for year in range(4):
+        n = 400
+        df = pd.DataFrame({
+            'Course': rng.choice(['A', 'B', 'C', None], n, p=[0.4, 0.3, 0.29, 0.01]),
+            'University': rng.choice(['U1', 'U2'], n),
+            'District': rng.choice(['x', 'Y', 'z'], n),
+            'Z_Score': np.where(rng.random(n) < 0.02, np.nan, rng.normal(1, 1, n) * np.pi),
+        })
+        file_path = str(tmp_path / f'year_{year}.csv')
+        df.to_csv(file_path, index=False)
+        file_paths.append(file_path)
+    return file_paths
+
+
+@pytest.mark.parametrize('chunk_size', [7, 100, 50000])
+def test_streamed_load_equals_in_memory_load(synthetic_files, monkeypatch, chunk_size):
+    monkeypatch.setattr(rs, 'LOAD_CHUNK_SIZE', chunk_size)
+    df_cutoffs = rs.load_data(synthetic_files, use_cache=False)
+    pd.testing.assert_frame_equal(averaged(df_cutoffs), reference_load(synthetic_files), check_exact=True)
+
+
+def test_real_data_load_equals_in_memory_load():
+    df_cutoffs = rs.load_data(REAL_FILES, use_cache=False)
+    pd.testing.assert_frame_equal(averaged(df_cutoffs), reference_load(REAL_FILES), check_exact=True)
+
+
+def test_parallel_load_equals_serial_load(synthetic_files):
+    serial = rs.load_data(synthetic_files, use_cache=False, workers=1)
+    parallel = rs.load_data(synthetic_files, use_cache=False, workers=2)
+    pd.testing.assert_frame_equal(parallel, serial, check_exact=True)
+
+
+def test_yearly_statistics(synthetic_files):
+    df_cutoffs = rs.load_data(synthetic_files, use_cache=False)
+    year_means = pd.concat(
+        [pd.read_csv(file_path).groupby(rs.GROUP_KEYS)['Z_Score'].mean().rename(year)
+         for year, file_path in enumerate(synthetic_files)], axis=1
+    )
+    year_means.index = year_means.index.set_levels(year_means.index.levels[2].str.upper(), level=2)
+    expected = pd.DataFrame({
+        'Z_Score_Min': year_means.min(axis=1),
+        'Z_Score_Max': year_means.max(axis=1),
+        'Year_Count': year_means.notna().sum(axis=1),
+    })
+    actual = df_cutoffs.dropna(subset=['Course']).astype({col: 'str' for col in rs.GROUP_KEYS})
+    actual = actual.set_index(rs.GROUP_KEYS)[list(expected.columns)].sort_index()
+    expected = expected.sort_index()
+    # The per-year sums are plain (not compensated) sums, so yearly means can differ in the last bits
+    pd.testing.assert_series_equal(actual['Year_Count'], expected['Year_Count'], check_exact=True, check_names=False)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-12, check_names=False)
+
+
+def test_key_without_z_score_has_no_cutoff(synthetic_files):
+    # A course whose only row has a blank Z-Score
+    with open(synthetic_files[-1], 'a') as data_file:
+        data_file.write('COMPUTER ENGINEERING,U1,colombo,\n')
+    df_cutoffs = rs.load_data(synthetic_files, use_cache=False)
+
+    no_z_score = df_cutoffs[df_cutoffs['Year_Count'] == 0]
+    assert 'COMPUTER ENGINEERING' in set(no_z_score['Course'])
+    assert no_z_score[['Z_Score', 'Z_Score_Min', 'Z_Score_Max', 'Z_Score_Weighted']].isna().all().all()
+    for cutoff_estimate in rs.CUTOFF_ESTIMATES:
+        recommendations = rs.calculate_compatibility_score(0.1, 'COLOMBO', 'ENGINEERING', 'IT', 'Mathamatics',
+                                                           df_cutoffs, cutoff_estimate=cutoff_estimate)
+        assert recommendations.empty
+
+
+def test_nan_z_score_gets_no_recommendations():
+    df_cutoffs = rs.load_data(REAL_FILES)
+    z_score = float('nan')
+    assert rs.calculate_compatibility_score(z_score, 'COLOMBO', 'ENGINEERING', 'IT', 'Mathamatics', df_cutoffs).empty
+    assert rs.calculate_multi_preference_score(z_score, ['COLOMBO', 'GAMPAHA'], ['ENGINEERING', 'IT', 'SCIENCE'],
+                                               'Mathamatics', df_cutoffs).empty
+
+
+@pytest.fixture(scope='module')
+def real_table():
+    """The table of the real data files, loaded once for the scoring tests."""
+    return rs.load_data(REAL_FILES, use_cache=False)
+
+
+def random_queries(df_cutoffs, count, seed):
+    """
+    Seeded single-student queries: Z-Scores around the cutoffs, known, lower-case
+    and unknown districts, every stream plus an unknown one, and preference pairs
+    (the primary field is never empty, as the original function required).
+    """
+    rng = np.random.default_rng(seed)
+    districts = sorted(df_cutoffs['District'].unique()) + ['colombo', 'NOWHERE']
+    streams = list(rs.STREAM_COURSE_MAP) + ['Unknown']
+    fields = rs.PREFERENCE_FIELD_OPTIONS + ['Computer', 'IT']
+    for _ in range(count):
+        yield {
+            'student_z_score': round(float(rng.uniform(-0.5, 3.0)), 4),
+            'district': str(rng.choice(districts)),
+            'primary_field': str(rng.choice(fields)),
+            'secondary_field': str(rng.choice(fields + [''])),
+            'stream': str(rng.choice(streams)),
+        }
+
+
+def reference_recommend(student_z_score, district, primary_field, secondary_field, stream, df_cutoffs):
+    """
+    The original calculate_compatibility_score: filter the whole table, score
+    every eligible row, then a stable sort (ties keep table order) and the top
+    RECOMMENDATION_COUNT.
+    """
+    keywords = rs.STREAM_COURSE_MAP.get(stream, [])
+    eligible_df = df_cutoffs
+    if keywords:
+        pattern = '|'.join(keywords)
+        eligible_df = eligible_df[eligible_df['Course'].str.contains(pattern, case=False, na=False)]
+    eligible_df = eligible_df[eligible_df['District'].str.upper() == district.upper()].copy()
+    if eligible_df.empty:
+        return pd.DataFrame()
+
+    z_score_diff = student_z_score - eligible_df['Z_Score']
+    eligible_df['Safety_Margin'] = z_score_diff
+    margin_score = np.clip(z_score_diff, 0, rs.MAX_ZSCORE_MARGIN_CAP) / rs.MAX_ZSCORE_MARGIN_CAP
+
+    course_names = eligible_df['Course'].astype(str)
+    boost = pd.Series(rs.BASE_BOOST_VALUE, index=eligible_df.index)
+    primary_mask = course_names.str.contains(primary_field, case=False, regex=False)
+    boost[primary_mask] = rs.PRIMARY_BOOST_VALUE
+    if secondary_field and secondary_field.lower() != primary_field.lower():
+        secondary_mask = course_names.str.contains(secondary_field, case=False, regex=False)
+        boost[secondary_mask & ~primary_mask] = rs.SECONDARY_BOOST_VALUE
+
+    eligible_df['Compatibility_Score'] = margin_score * rs.WEIGHT_MARGIN + boost * rs.WEIGHT_PREFERENCE
+    eligible_df = eligible_df[eligible_df['Z_Score'] <= student_z_score]
+    recommendations = eligible_df.sort_values('Compatibility_Score', ascending=False, kind='stable')
+    recommendations = recommendations.head(rs.RECOMMENDATION_COUNT)
+    recommendations['Safety_Margin'] = recommendations['Safety_Margin'].round(4)
+    return recommendations[rs.RECOMMENDATION_COLUMNS]
+
+
+def assert_same_recommendations(actual, expected):
+    """Same courses in the same order with the same values (an empty result has no columns)."""
+    if expected.empty:
+        assert actual.empty
+        return
+    actual_values = actual[rs.RECOMMENDATION_COLUMNS].astype(object).to_numpy()
+    expected_values = expected[rs.RECOMMENDATION_COLUMNS].astype(object).to_numpy()
+    assert actual_values.shape == expected_values.shape
+    assert (actual_values == expected_values).all()
+
+
+@pytest.mark.parametrize('k', [0, 1, 5, 19, 20, 25])
+def test_rank_top_k_orders_ties_by_tiebreak(k):
+    rng = np.random.default_rng(k)
+    scores = rng.integers(0, 4, size=(50, 20)).astype(float)  # Many ties
+    tiebreak = rng.permutation(20)
+
+    for row in scores:
+        expected = np.lexsort((tiebreak, -row))[:k]
+        np.testing.assert_array_equal(rs.rank_top_k(row, k, tiebreak), expected)
+        np.testing.assert_array_equal(rs.rank_top_k(row, k), np.lexsort((np.arange(20), -row))[:k])
+
+    expected = np.array([np.lexsort((tiebreak, -row))[:k] for row in scores]).reshape(len(scores), min(k, 20))
+    np.testing.assert_array_equal(rs.rank_top_k(scores, k, tiebreak), expected)
+
+
+def test_compatibility_score_matches_reference(real_table):
+    for query in random_queries(real_table, 300, seed=1):
+        assert_same_recommendations(rs.calculate_compatibility_score(df_cutoffs=real_table, **query),
+                                    reference_recommend(df_cutoffs=real_table, **query))
+
+
+def test_scoring_buffers_are_per_thread(real_table):
+    queries = list(random_queries(real_table, 200, seed=2))
+    expected = [rs.calculate_compatibility_score(df_cutoffs=real_table, **query) for query in queries]
+
+    def score_all(offset):
+        # Each thread walks the queries from its own start, so buffer sizes interleave
+        order = [(i + offset) % len(queries) for i in range(len(queries))]
+        return order, [rs.calculate_compatibility_score(df_cutoffs=real_table, **queries[i]) for i in order]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for order, results in executor.map(score_all, range(0, 200, 50)):
+            for i, result in zip(order, results):
+                pd.testing.assert_frame_equal(result, expected[i], check_exact=True)
+
+
+@pytest.mark.parametrize('k', [None, 3])
+def test_batch_matches_single_queries(real_table, k):
+    queries = list(random_queries(real_table, 300, seed=3))
+    roster = pd.DataFrame({
+        'Student_ID': [f'S{i}' for i in range(len(queries))],
+        'Z_Score': [query['student_z_score'] for query in queries],
+        'District': [query['district'] for query in queries],
+        'Primary_Field': [query['primary_field'] for query in queries],
+        'Secondary_Field': [query['secondary_field'] for query in queries],
+        'Stream': [query['stream'] for query in queries],
+    })
+    batch = rs.recommend_batch(roster, real_table, k=k)
+
+    for student_id, query in zip(roster['Student_ID'], queries):
+        student_rows = batch[batch['Student_ID'] == student_id]
+        assert list(student_rows['Rank']) == list(range(1, len(student_rows) + 1))
+        assert_same_recommendations(student_rows, rs.calculate_compatibility_score(df_cutoffs=real_table, k=k, **query))
+
+
+@pytest.mark.parametrize('cutoff_estimate', [None, 'projected'])
+def test_one_district_two_fields_matches_single_query(real_table, cutoff_estimate):
+    for query in random_queries(real_table, 200, seed=4):
+        expected = rs.calculate_compatibility_score(df_cutoffs=real_table, cutoff_estimate=cutoff_estimate, **query)
+        actual = rs.calculate_multi_preference_score(
+            query['student_z_score'], [query['district']], [query['primary_field'], query['secondary_field']],
+            query['stream'], real_table, cutoff_estimate=cutoff_estimate
+        )
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+
+@pytest.mark.parametrize('candidate_lists', [False, True])
+def test_cache_matches_single_queries(real_table, candidate_lists):
+    cache = rs.RecommendationCache(maxsize=50, candidate_lists=candidate_lists)
+    queries = list(random_queries(real_table, 150, seed=5))
+    # The second pass is served from the cache (or the cached candidate lists)
+    for query in queries + queries[::-1]:
+        pd.testing.assert_frame_equal(cache.recommend(df_cutoffs=real_table, **query),
+                                      rs.calculate_compatibility_score(df_cutoffs=real_table, **query),
+                                      check_exact=True)
+    assert cache.hits > 0
+
+
+def test_sweep_matches_single_queries(real_table):
+    for query in random_queries(real_table, 100, seed=6):
+        sweep = rs.ZScoreSweep(query['district'], query['primary_field'], query['secondary_field'], query['stream'],
+                               real_table)
+        # The query's Z-Score, exact breakpoints and their neighbours
+        breakpoints = sweep.breakpoints[::max(1, len(sweep.breakpoints) // 3)]
+        z_scores = np.unique(np.concatenate([[query['student_z_score']], breakpoints,
+                                             np.nextafter(breakpoints, np.inf)]))
+        sweep_results = sweep.recommend(z_scores)
+        for z_score in z_scores:
+            expected = rs.calculate_compatibility_score(z_score, query['district'], query['primary_field'],
+                                                        query['secondary_field'], query['stream'], real_table)
+            actual = sweep_results[sweep_results['Student_Z_Score'] == z_score]
+            assert_same_recommendations(actual, expected)
+
+
+def is_memory_mapped(array):
+    """True if the array's memory belongs to a memory map."""
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def test_shared_table_is_memory_mapped(tmp_path):
+    df_cutoffs = rs.load_data(REAL_FILES)
+    rs.publish_shared_table(df_cutoffs, str(tmp_path))
+    shared_df = rs.attach_shared_table(str(tmp_path))
+
+    assert shared_df.equals(df_cutoffs)
+    assert is_memory_mapped(shared_df.index.to_numpy())
+    for col in rs.GROUP_KEYS:
+        assert is_memory_mapped(shared_df[col].array.codes)
+    for col in rs.CUTOFF_VALUE_COLUMNS:
+        assert is_memory_mapped(shared_df[col].to_numpy())
+
+
+def assert_same_table(actual, expected, exact_means=True):
+    """
+    Same keys, order, row numbers and counts; the means are compared exactly,
+    or to the last bits when a key repeats inside a year (see drop_year).
+    """
+    pd.testing.assert_frame_equal(actual[rs.GROUP_KEYS + ['Year_Count']], expected[rs.GROUP_KEYS + ['Year_Count']],
+                                  check_exact=True)
+    pd.testing.assert_frame_equal(actual[rs.CUTOFF_VALUE_COLUMNS], expected[rs.CUTOFF_VALUE_COLUMNS],
+                                  check_exact=exact_means, rtol=1e-12)
+
+
+@pytest.mark.parametrize('use_real_files', [True, False])
+def test_table_store_drops_and_adds_years(synthetic_files, use_real_files):
+    file_paths = REAL_FILES if use_real_files else synthetic_files
+    # The real files have no key repeated inside a year, so every step is exact there
+    exact_means = use_real_files
+
+    store = rs.CutoffTableStore(file_paths)
+    assert_same_table(store.current()[0], rs.load_data(file_paths, use_cache=False))
+
+    # Drop a middle year, add it back as the latest year, then drop the oldest year
+    steps = [[file_paths[0], file_paths[2]], [file_paths[0], file_paths[2], file_paths[1]], [file_paths[2], file_paths[1]]]
+    for step in steps:
+        assert store.sync(step)
+        assert store.file_paths == step
+        assert_same_table(store.current()[0], rs.load_data(step, use_cache=False), exact_means)
+
+    # Unchanged: nothing is rebuilt
+    table = store.current()
+    assert not store.sync(list(store.file_paths))
+    assert store.current() is table
+
+
+def test_table_store_starts_from_the_cache(synthetic_files, monkeypatch):
+    rs.load_data(synthetic_files[:3])  # Writes the cache
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("The data files were parsed instead of read from the cache.")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(rs, 'load_cutoff_accumulator', no_parsing)
+        store = rs.CutoffTableStore(synthetic_files[:3])
+    pd.testing.assert_frame_equal(store.current()[0], rs.load_data(synthetic_files[:3], use_cache=False),
+                                  check_exact=True)
+
+    # The first change builds the running sums of the kept years
+    assert store.sync(synthetic_files[1:])
+    assert_same_table(store.current()[0], rs.load_data(synthetic_files[1:], use_cache=False), exact_means=False)
+
+
+def test_table_store_rolling_window(synthetic_files):
+    store = rs.CutoffTableStore(synthetic_files[:2])
+    for start in range(1, len(synthetic_files) - 1):
+        window = synthetic_files[start:start + 2]
+        assert store.sync(window)
+        assert_same_table(store.current()[0], rs.load_data(window, use_cache=False), exact_means=False)
+
+
+def test_drop_year_renumbers_first_rows(synthetic_files):
+    accumulator = rs.load_cutoff_accumulator(synthetic_files)
+    assert accumulator.drop_year(synthetic_files[0])
+    assert not accumulator.drop_year(synthetic_files[0])
+
+    fresh = rs.load_cutoff_accumulator(synthetic_files[1:])
+    assert accumulator.key_ids == fresh.key_ids
+    assert accumulator.rows_read == fresh.rows_read
+    np.testing.assert_array_equal(accumulator.to_frame().index, fresh.to_frame().index)